@@ -0,0 +1,36 @@
+"""create_search_ngrams_table
+
+Revision ID: 4f2c7a9e1b3d
+Revises: da1d08392a92
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2c7a9e1b3d'
+down_revision = 'da1d08392a92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('search_ngrams',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('column_name', sa.String(length=64), nullable=False),
+    sa.Column('record_id', sa.BigInteger(), nullable=False),
+    sa.Column('gram', sa.String(length=16), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_search_ngrams_lookup', 'search_ngrams', ['table_name', 'column_name', 'gram', 'record_id'])
+    op.create_index('ix_search_ngrams_record', 'search_ngrams', ['table_name', 'record_id'])
+    # existing rows are indexed by `make ngram-backfill`
+
+
+def downgrade():
+    op.drop_index('ix_search_ngrams_record', table_name='search_ngrams')
+    op.drop_index('ix_search_ngrams_lookup', table_name='search_ngrams')
+    op.drop_table('search_ngrams')
@@ -0,0 +1,118 @@
+from typing import Any, Dict, Generic, List, Optional, Type, Union
+
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import CacheBackend
+from app.core.events import WriteAction, dispatch_model_write
+from app.core.logger import LOGGER
+from app.core.model import Base
+from app.core.ngram import index_record, index_records, ngram_columns, unindex_record
+from app.core.repository import FROM_CACHE_KEY, CreateSchemaType, ModelRepository, ModelType, UpdateSchemaType
+
+
+class AsyncBaseRepository(ModelRepository[ModelType], Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    def __init__(self, model: Type[ModelType], cache: CacheBackend = None, optimistic_lock: bool = False):
+        """
+        Async counterpart of `BaseRepository` over an `AsyncSession`, writes dispatch the same model write
+        events, so caches of the sync repositories are kept in sync.
+
+        **Parameters**
+
+        * `model`: A SQLAlchemy model class
+        * `cache`: Opt-in identity cache of `find` by primary key, may be shared with the sync repository
+        * `optimistic_lock`: `update` fails with a conflict when `updated_at` changed since the object was loaded,
+          it must be loaded (without RETURNING, reload an object after updating it)
+        """
+        super().__init__(model, cache=cache, optimistic_lock=optimistic_lock)
+
+    async def find(self, db: AsyncSession, id: Any, use_cache: bool = True) -> Optional[ModelType]:
+        if self.cache is None or not use_cache:
+            return await db.get(self.model, id)
+
+        db_obj = self._cached(db.identity_map, id)
+        if db_obj is not None:
+            if not inspect(db_obj).detached:
+                return db_obj
+            return self._merged(await db.merge(db_obj, load=False))
+
+        db_obj = await db.get(self.model, id)
+        if db_obj is not None:
+            # writes of an async session are committed one by one, what it reads is committed
+            self.cache.set(self._cache_key(db_obj.id), self._cache_values(db_obj))
+        return db_obj
+
+    async def find_by_columns(self, db: AsyncSession, **kwargs) -> Optional[ModelType]:
+        result = await db.execute(self._find_statement(tuple(sorted(kwargs))), kwargs)
+        return result.scalars().first()
+
+    async def get(self, db: AsyncSession, *filter_conditions) -> List[ModelType]:
+        result = await db.execute(select(self.model).filter(*filter_conditions))
+        return result.scalars().all()
+
+    async def create(self, db: AsyncSession, obj_in: CreateSchemaType) -> ModelType:
+        try:
+            db_obj: Base = self.model()
+            db_obj.fill(obj_in)
+            db.add(db_obj)
+            await self._index_ngrams(db, db_obj)
+            await db.commit()
+            await db.refresh(db_obj)
+        except Exception as e:
+            LOGGER.error(str(e))
+            await db.rollback()
+            raise
+
+        dispatch_model_write(self.model, WriteAction.CREATE, db_obj)
+        return db_obj
+
+    async def update(
+            self,
+            db: AsyncSession,
+            db_obj: ModelType,
+            obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+    ) -> ModelType:
+        try:
+            if inspect(db_obj).info.pop(FROM_CACHE_KEY, False):
+                await db.refresh(db_obj)
+            changes = self._update_changes(db_obj, obj_in)
+            if not changes:
+                return db_obj
+
+            result = await db.execute(self._update_statement(db, db_obj, changes))
+            self._apply_update(db, db_obj, changes, result)
+            if ngram_columns(self.model):
+                await db.run_sync(index_records, self.model, [{**changes, "id": db_obj.id}])
+            await db.commit()
+        except Exception as e:
+            LOGGER.error(str(e))
+            await db.rollback()
+            raise
+
+        dispatch_model_write(self.model, WriteAction.UPDATE, db_obj)
+        return db_obj
+
+    async def remove(self, db: AsyncSession, id: int, model: ModelType = None) -> ModelType:
+        try:
+            if model is None:
+                model = await db.get(self.model, id)
+
+            if ngram_columns(self.model):
+                await db.run_sync(unindex_record, self.model, model.id)
+            await db.delete(model)
+            await db.commit()
+        except Exception as e:
+            LOGGER.error(str(e))
+            await db.rollback()
+            raise
+
+        dispatch_model_write(self.model, WriteAction.REMOVE, model)
+        return model
+
+    async def _index_ngrams(self, db: AsyncSession, db_obj: ModelType):
+        if not ngram_columns(self.model):
+            return
+
+        # new records need their id before the n-grams can reference it
+        await db.flush()
+        await db.run_sync(index_record, db_obj)
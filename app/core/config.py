@@ -1,6 +1,7 @@
 from typing import Any, Dict, List, Optional, Union
 
 from pydantic import AnyHttpUrl, AnyUrl, BaseSettings, EmailStr, HttpUrl, validator
+from sqlalchemy.engine import make_url
 
 
 class Settings(BaseSettings):
@@ -41,6 +42,18 @@ class Settings(BaseSettings):
     MYSQL_DATABASE: str
     SQLALCHEMY_DATABASE_URI: Optional[AnyUrl] = None
     SQLALCHEMY_DEBUG: bool = False
+    # read replicas, JSON-formatted list of database URIs, reads are sent to the primary when empty
+    SQLALCHEMY_REPLICA_URIS: List[str] = []
+    # seconds a failing replica is left out of the rotation
+    REPLICA_RETRY_SECONDS: float = 30
+    # seconds tables written by this process are read from the primary, covering the replication lag
+    REPLICA_READ_AFTER_WRITE_SECONDS: float = 5
+
+    @validator("SQLALCHEMY_REPLICA_URIS", pre=True)
+    def assemble_replica_uris(cls, v: Union[str, List[str]]) -> List[str]:
+        if isinstance(v, str):
+            return [i.strip() for i in v.split(",") if i.strip()]
+        return v
 
     @validator("SQLALCHEMY_DATABASE_URI", pre=True)
     def assemble_db_connection(cls, v: Optional[str], values: Dict[str, Any]) -> Any:
@@ -49,6 +62,30 @@ class Settings(BaseSettings):
         return f'mysql+pymysql://{values.get("MYSQL_USER")}:{values.get("MYSQL_PASSWORD")}' \
                f'@{values.get("MYSQL_HOST")}:{values.get("MYSQL_PORT")}/{values.get("MYSQL_DATABASE")}'
 
+    # used by `app.db.async_session`, same database through the aiomysql driver
+    ASYNC_SQLALCHEMY_DATABASE_URI: Optional[AnyUrl] = None
+
+    @validator("ASYNC_SQLALCHEMY_DATABASE_URI", pre=True)
+    def assemble_async_db_connection(cls, v: Optional[str], values: Dict[str, Any]) -> Any:
+        if isinstance(v, str):
+            return v
+        return f'mysql+aiomysql://{values.get("MYSQL_USER")}:{values.get("MYSQL_PASSWORD")}' \
+               f'@{values.get("MYSQL_HOST")}:{values.get("MYSQL_PORT")}/{values.get("MYSQL_DATABASE")}'
+
+    # replicas of `SQLALCHEMY_REPLICA_URIS` through the aiomysql driver, unless given
+    ASYNC_SQLALCHEMY_REPLICA_URIS: List[str] = []
+
+    @validator("ASYNC_SQLALCHEMY_REPLICA_URIS", pre=True, always=True)
+    def assemble_async_replica_uris(cls, v: Union[str, List[str]], values: Dict[str, Any]) -> List[str]:
+        if isinstance(v, str):
+            v = [i.strip() for i in v.split(",") if i.strip()]
+        if v:
+            return v
+        return [
+            make_url(uri).set(drivername="mysql+aiomysql").render_as_string(hide_password=False)
+            for uri in values.get("SQLALCHEMY_REPLICA_URIS") or []
+        ]
+
     SMTP_TLS: bool = True
     SMTP_PORT: Optional[int] = None
     SMTP_HOST: Optional[str] = None
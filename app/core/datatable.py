@@ -1,26 +1,60 @@
 import abc
+import asyncio
+import base64
+import csv
+import io
+import json
 import logging
-import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from enum import Enum
+from functools import partial
+from inspect import isawaitable
 from logging import Logger
-from typing import TypeVar, List, Any, Dict, Optional, Type, Callable, Union, Tuple
+from types import SimpleNamespace
+from typing import TypeVar, List, Any, Dict, Optional, Type, Callable, Union, Tuple, Hashable, Set, Iterator, \
+    AsyncIterator, Sequence, DefaultDict, Generator
 
+import anyio
+from anyio import CapacityLimiter
 from fastapi import Response, Request, Query
+from fastapi.responses import StreamingResponse
+from inflection import underscore
 from pydantic import BaseModel
-from sqlalchemy import Column, or_
+from sqlalchemy import JSON, Column, LargeBinary, Text, and_, event, func, inspect, or_, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session, Query as SQLQuery
 from sqlalchemy.orm.attributes import InstrumentedAttribute
+from sqlalchemy.sql import ColumnElement
 
+from app.core.cache import TTLCache
+from app.core.events import WriteAction, on_model_write
 from app.core.logger import LOGGER
-from app.core.response import BadPayloadException, success_response
+from app.core.ngram import NGRAM_INFO_KEY, ngram_columns, ngram_condition
+from app.core.response import BadPayloadException, VHTTPException, success_response
+from app.core.search import SearchMode, WordMatch, FULLTEXT_MIN_TOKEN_SIZE, fulltext_condition, prefix_condition, \
+    substring_condition
 
 ModelType = TypeVar("ModelType")
 DEFAULT_LIMIT = 25
 MAX_LIMIT = 100
+EXPORT_CHUNK_SIZE = 1000
+SLOW_THRESHOLD_MS = 1000
+# smart search caps, so a hostile keyword can't blow up the generated SQL
+MAX_SEARCH_WORDS = 8
+MAX_KEYWORD_LENGTH = 200
+# concurrent renders of a datatable class running database work in the threadpool
+DEFAULT_MAX_CONCURRENCY = 10
 ROW_INDEX_COLUMN_NAME_DEFAULT = "DT_RowIndex"
+WINDOW_COUNT_LABEL = "dt_filtered_records"
 
 FilterColumnFunc = Callable[[str], Any]
+# receives the whole page of records and the request-bound datatable, returns one value per record
+# (or an awaitable of them)
+BatchProducerFunc = Callable[[List[Any], "BaseDataTable"], Any]
 
 local_logger = logging.getLogger("Datatable")
 
@@ -35,6 +69,7 @@ class DataTableColumn:
             exportable: bool = False,
             printable: bool = False,
             class_name: str = '',
+            search: SearchMode = SearchMode.SUBSTRING,
     ):
         title_from_data = data.key if isinstance(data, InstrumentedAttribute) else data
         self.title: str = title or title_from_data
@@ -44,23 +79,60 @@ class DataTableColumn:
         self.exportable = exportable
         self.printable = printable
         self.class_name = class_name
+        self.search = search
 
         # closures
         self.filter: Optional[FilterColumnFunc] = None
 
+    @property
+    def name(self) -> str:
+        return self.data.key if isinstance(self.data, InstrumentedAttribute) else self.data
+
 
 class Action(str, Enum):
     AJAX = "ajax"
     EXCEL = "excel"
-    # CSV = "csv"
+    CSV = "csv"
     # PDF = "pdf"
 
 
+class Pagination(str, Enum):
+    OFFSET = "offset"
+    KEYSET = "keyset"
+
+
+class Projection(str, Enum):
+    # full ORM entities
+    ENTITY = "entity"
+    # only columns of `column_defs`, columns required by `add_column` and the primary key
+    DEFINED = "defined"
+    # every column of the queried model except large ones (Text, binary, JSON), unless named in `column_defs`
+    SCALAR = "scalar"
+
+
+class DataTableRecord(SimpleNamespace):
+    """
+    Lightweight row of a projected datatable, no identity map nor ORM attribute instrumentation.
+    """
+
+
+class CountStrategy(str, Enum):
+    # pick `WINDOW` when the database supports window functions, else `SEPARATE`
+    AUTO = "auto"
+    # `COUNT(*) OVER()` column fetched together with the page rows
+    WINDOW = "window"
+    # a separate `SELECT COUNT(*)` over the filtered query
+    SEPARATE = "separate"
+
+
 class DataTableResult(BaseModel):
-    totalRecords: int
-    filteredRecords: int
+    totalRecords: Optional[int]
+    filteredRecords: Optional[int]
     items: List[Any]
     others: Dict[str, Any]
+    nextCursor: Optional[str] = None
+    prevCursor: Optional[str] = None
+    hasMore: Optional[bool] = None
 
 
 @dataclass
@@ -70,9 +142,333 @@ class DataTableOption:
     page: int = 1
     limit: int = DEFAULT_LIMIT
     action: Action = Action.AJAX
+    after: Optional[str] = None
+    before: Optional[str] = None
+    count: bool = True
+    sort: Optional[str] = None
     others: Dict[str, Any] = field(default_factory=dict)
 
 
+async def gather_values(values: List[Any]) -> List[Any]:
+    """
+    Await every awaitable of `values` concurrently, keeping plain values in place.
+    """
+    positions = [position for position, value in enumerate(values) if isawaitable(value)]
+    results = await asyncio.gather(*(values[position] for position in positions))
+    values = list(values)
+    for position, result in zip(positions, results):
+        values[position] = result
+    return values
+
+
+def encode_cursor(value: Any) -> str:
+    raw = json.dumps({"k": value}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Any:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        return json.loads(raw)["k"]
+    except (ValueError, KeyError, TypeError):
+        raise BadPayloadException(message="Invalid `cursor` params!")
+
+
+def query_cache_key(query: SQLQuery) -> Hashable:
+    compiled = query.statement.compile(dialect=query.session.get_bind().dialect)
+    return str(compiled), repr(sorted(compiled.params.items()))
+
+
+def is_indexed(attribute: InstrumentedAttribute) -> bool:
+    """
+    Whether an index (or unique constraint) starts with the column, so the database can sort by it without filesort.
+    """
+    column = attribute.property.columns[0]
+    if column.primary_key or column.index or column.unique:
+        return True
+
+    table = column.table
+    leading_columns = [list(index.columns)[:1] for index in table.indexes]
+    leading_columns += [list(constraint.columns)[:1] for constraint in table.constraints
+                        if hasattr(constraint, "columns")]
+    return any(columns and columns[0] is column for columns in leading_columns)
+
+
+_unindexed_sort_warned: Set[Tuple[Type, str]] = set()
+_limiters: Dict[Tuple[Type, int], CapacityLimiter] = {}
+_definitions_lock = threading.Lock()
+
+
+def query_models(query: SQLQuery) -> List[Type]:
+    return [
+        description["entity"]
+        for description in query.column_descriptions
+        if description.get("entity") is not None
+    ]
+
+
+class CountProvider(abc.ABC):
+    """
+    Strategy to get the total records of the datatable base query.
+    """
+
+    @abc.abstractmethod
+    def count(self, datatable: "BaseDataTable") -> int:
+        raise NotImplementedError
+
+
+class ExactCount(CountProvider):
+    def count(self, datatable: "BaseDataTable") -> int:
+        return datatable._count()
+
+
+class CachedCount(CountProvider):
+    """
+    Keep exact counts for `ttl` seconds, keyed by datatable class and compiled base query.
+    """
+
+    def __init__(self, ttl: float = 60, maxsize: int = 256):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def count(self, datatable: "BaseDataTable") -> int:
+        key = (datatable.__class__, query_cache_key(datatable.query_statement))
+        total = self.cache.get(key)
+        if total is None:
+            total = datatable._count()
+            self.cache.set(key, total)
+        return total
+
+
+class TrackedCount(CountProvider):
+    """
+    Seed counters with an exact count, then keep them up to date with `BaseRepository.create/remove`.
+
+    Only base queries without filters are tracked, a write can't tell whether its row matches them, use
+    `CachedCount` for filtered ones. Rows written outside repositories, or by other processes, make the counters
+    drift, so they are re-seeded every `resync_after` seconds.
+    """
+
+    def __init__(self, resync_after: float = 300):
+        self.resync_after = resync_after
+        self._counters: Dict[Hashable, List] = {}
+        self._models: Dict[Hashable, List[Type]] = {}
+        self._lock = threading.Lock()
+
+    def count(self, datatable: "BaseDataTable") -> int:
+        if datatable.query_statement.whereclause is not None:
+            raise ValueError(f"`{datatable.__class__.__name__}` filters its base query, use `CachedCount`!")
+
+        key = (datatable.__class__, query_cache_key(datatable.query_statement))
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is not None and counter[1] > time.monotonic():
+                return counter[0]
+
+        total = datatable._count()
+        models = query_models(datatable.query_statement)
+        with self._lock:
+            self._counters[key] = [total, time.monotonic() + self.resync_after]
+            self._models[key] = models
+        for model in models:
+            on_model_write(model, self._on_write)
+        return total
+
+    def _on_write(self, model: Type, action: WriteAction, obj: Any):
+        if action == WriteAction.UPDATE:
+            return
+
+        with self._lock:
+            for key, models in self._models.items():
+                if not any(issubclass(model, m) for m in models):
+                    continue
+                if obj is None:
+                    # unknown number of rows, re-seed on next read
+                    self._counters[key][1] = 0
+                else:
+                    self._counters[key][0] += 1 if action == WriteAction.CREATE else -1
+
+
+class ApproximateCount(CountProvider):
+    """
+    Use the row estimate kept by the database (MySQL `information_schema`, PostgreSQL `pg_class`).
+
+    Filters of the base query are ignored by the estimate. Tables estimated below `exact_below` rows,
+    and dialects without an estimate, are counted exactly.
+    """
+
+    def __init__(self, exact_below: int = 10000):
+        self.exact_below = exact_below
+
+    def count(self, datatable: "BaseDataTable") -> int:
+        estimate = self._estimate(datatable)
+        if estimate is None or estimate < self.exact_below:
+            return datatable._count()
+        return estimate
+
+    @staticmethod
+    def _estimate(datatable: "BaseDataTable") -> Optional[int]:
+        models = query_models(datatable.query_statement)
+        if not models:
+            return None
+
+        session = datatable.session
+        table_name = models[0].__table__.name
+        dialect = session.get_bind().dialect.name
+        if dialect == "mysql":
+            estimate = session.execute(
+                text("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                     "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name"),
+                {"table_name": table_name}
+            ).scalar()
+        elif dialect == "postgresql":
+            estimate = session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table_name)"),
+                {"table_name": table_name}
+            ).scalar()
+        else:
+            return None
+
+        return None if estimate is None or estimate < 0 else int(estimate)
+
+
+class DataTableCache:
+    """
+    Cache of rendered datatable pages, keyed by datatable class, normalized keyword, page, limit, sort,
+    cursor and `BaseDataTable.cache_scope()`.
+
+    Entries of a datatable are dropped when `BaseRepository.create/update/remove` writes to a model the
+    datatable reads, other writes are only caught up by `ttl`.
+    """
+
+    def __init__(self, ttl: float = 30, maxsize: int = 512):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._caches: Dict[Type, TTLCache] = {}
+        self._generations: DefaultDict[Type, int] = defaultdict(int)
+        self._dependents: DefaultDict[Type, Set[Type]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(datatable: "BaseDataTable") -> Hashable:
+        option = datatable.option
+        words = [word.lower() for word in datatable._search_keywords()]
+        keyword = " ".join(sorted(words) if datatable.smart_search else words)
+        sort = ",".join(item.strip() for item in (option.sort or "").split(",") if item.strip())
+        return (
+            keyword, option.page, option.limit, sort, option.after, option.before, option.count,
+            datatable.cache_scope(),
+        )
+
+    def generation(self, datatable_cls: Type) -> int:
+        return self._generations[datatable_cls]
+
+    def get(self, datatable: "BaseDataTable") -> Optional[Dict[str, Any]]:
+        return self._cache(datatable).get(self.key(datatable))
+
+    def set(self, datatable: "BaseDataTable", data: Dict[str, Any], generation: int):
+        with self._lock:
+            # a write happened while rendering, the data may already be stale
+            if generation != self._generations[datatable.__class__]:
+                return
+        self._cache(datatable).set(self.key(datatable), data)
+
+    def invalidate(self, datatable_cls: Type = None):
+        with self._lock:
+            classes = [datatable_cls] if datatable_cls else list(self._caches.keys())
+            for cls in classes:
+                self._generations[cls] += 1
+                if cls in self._caches:
+                    self._caches[cls].clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_datatable = {cls.__name__: cache.stats() for cls, cache in self._caches.items()}
+        return {
+            "hits": sum(stats["hits"] for stats in per_datatable.values()),
+            "misses": sum(stats["misses"] for stats in per_datatable.values()),
+            "datatables": per_datatable,
+        }
+
+    def _cache(self, datatable: "BaseDataTable") -> TTLCache:
+        cls = datatable.__class__
+        cache = self._caches.get(cls)
+        if cache is not None:
+            return cache
+
+        with self._lock:
+            if cls not in self._caches:
+                self._caches[cls] = TTLCache(maxsize=self.maxsize, ttl=self.ttl)
+                for model in datatable.models():
+                    self._dependents[model].add(cls)
+                    on_model_write(model, self._on_write)
+            return self._caches[cls]
+
+    def _on_write(self, model: Type, action: WriteAction, obj: Any):
+        for dependent_model, classes in list(self._dependents.items()):
+            if issubclass(model, dependent_model):
+                for cls in list(classes):
+                    self.invalidate(cls)
+
+
+class SQLCapture:
+    """
+    Record statements executed by a session, on the primary and on replicas alike, used by `debug_sql`
+    to attach the SQL and its EXPLAIN output.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.statements: List[Tuple[Any, str, Any]] = []
+        event.listen(session, "do_orm_execute", self._do_orm_execute)
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+
+    def _do_orm_execute(self, orm_execute_state):
+        # engines are shared by every session, the statements of this one are told apart by this option
+        orm_execute_state.update_execution_options(sql_capture=self)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None and context.execution_options.get("sql_capture") is self:
+            self.statements.append((conn, statement, parameters,))
+
+    def stop(self):
+        event.remove(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(self.session, "do_orm_execute", self._do_orm_execute)
+
+    def explain(self) -> List[Dict[str, Any]]:
+        debug = []
+        for conn, statement, parameters in self.statements:
+            item: Dict[str, Any] = {"sql": statement, "params": parameters}
+            if statement.lstrip().upper().startswith("SELECT"):
+                # on the connection which ran it, a replica may not have the plan of the primary
+                prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+                try:
+                    rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+                    item["explain"] = [list(row) for row in rows]
+                except Exception as e:
+                    item["explain"] = str(e)
+            debug.append(item)
+        return debug
+
+
+Matcher = Callable[[str], Any]
+
+
+@dataclass
+class DataTableDefinition:
+    """
+    Column metadata of a datatable class, compiled once from `get_columns()` and `modified_datatable()`
+    and shared read-only by every instance.
+    """
+    column_defs: Dict[str, DataTableColumn]
+    additional_cols: List[Tuple[str, BatchProducerFunc]]
+    required_cols: List[InstrumentedAttribute]
+    include_index: Tuple[bool, Optional[str]]
+    searchable_columns: List[DataTableColumn]
+    exportable_columns: List[DataTableColumn]
+    # dialect -> (matchers, fulltext columns), see `BaseDataTable._search_plan`
+    search_plans: Dict[str, Tuple[List[Matcher], List[InstrumentedAttribute]]] = field(default_factory=dict)
+
+
 class IBaseDataTable:
     def __init__(self):
         self.column_defs: Dict[str, DataTableColumn] = {}
@@ -80,7 +476,11 @@ class IBaseDataTable:
 
 class IModifiedDatatableAction:
     @abc.abstractmethod
-    def add_column(self, column_name, producer: Callable[..., Any]):
+    def add_column(self, column_name, producer: Callable[..., Any], requires: List[Column] = None):
+        return self
+
+    @abc.abstractmethod
+    def add_batch_column(self, column_name, producer: BatchProducerFunc, requires: List[Column] = None):
         return self
 
     @abc.abstractmethod
@@ -94,15 +494,52 @@ class IModifiedDatatableAction:
 
 class ModifiedDatatableAction(IModifiedDatatableAction, IBaseDataTable):
     def add_index_column(self, column_name: str = ROW_INDEX_COLUMN_NAME_DEFAULT):
+        """
+        Number the rows from 1 on the first page. It is `None` in keyset mode: a keyset page doesn't know
+        how many rows come before it, counting them would cost the scan keyset pagination avoids.
+        """
         self.include_index = (True, column_name,)
 
     def __init__(self):
         super().__init__()
-        self.additional_cols: List[Tuple[str, Callable]] = []
+        self.additional_cols: List[Tuple[str, BatchProducerFunc]] = []
+        self.required_cols: List[InstrumentedAttribute] = []
         self.include_index: Tuple[bool, Optional[str]] = (False, None,)
 
-    def add_column(self, column_name: str, producer: Callable[..., Any]) -> IModifiedDatatableAction:
+    def add_column(
+            self,
+            column_name: str,
+            producer: Callable[..., Any],
+            requires: List[Column] = None
+    ) -> IModifiedDatatableAction:
+        """
+        Per record producer, `producer(record)` may return an awaitable, those of a page run concurrently.
+        `requires` are the columns read by `producer`, they are selected in projection mode.
+        Producers which query the database belong in `add_batch_column`.
+        """
+
+        def batch_producer(records: List[Any], datatable: "BaseDataTable") -> Any:
+            values = [producer(record) for record in records]
+            if any(isawaitable(value) for value in values):
+                return gather_values(values)
+            return values
+
+        return self.add_batch_column(column_name, batch_producer, requires=requires)
+
+    def add_batch_column(
+            self,
+            column_name: str,
+            producer: BatchProducerFunc,
+            requires: List[Column] = None
+    ) -> IModifiedDatatableAction:
+        """
+        `producer(records, datatable)` receives the whole page and returns a sequence with one value per record,
+        so related rows can be loaded with a single query through `datatable.session`. `datatable` is the
+        instance rendering the request, not the one `modified_datatable()` ran on. It may be async,
+        async producers of a page run concurrently after the sync ones.
+        """
         self.additional_cols.append((column_name, producer,))
+        self.required_cols.extend(requires or [])
         return self
 
     def filter_column(self, column_name: Union[str, Column], producer: FilterColumnFunc) -> IModifiedDatatableAction:
@@ -120,29 +557,109 @@ class BaseDataTable(ModifiedDatatableAction):
             self,
             max_limit: int = DEFAULT_LIMIT,
             smart_search: bool = True,
+            word_match: WordMatch = WordMatch.ALL,
+            max_search_words: int = MAX_SEARCH_WORDS,
             logger: Logger = local_logger,
+            pagination: Pagination = Pagination.OFFSET,
+            count_strategy: CountStrategy = CountStrategy.AUTO,
+            count_provider: CountProvider = None,
+            strict_ordering: bool = False,
+            export_chunk_size: int = EXPORT_CHUNK_SIZE,
+            projection: Projection = Projection.ENTITY,
+            result_cache: DataTableCache = None,
+            slow_threshold_ms: Optional[float] = SLOW_THRESHOLD_MS,
+            debug_sql: bool = False,
+            offload: bool = True,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
             **kwargs
     ):
-        super().__init__()
-        self._id = random.randint(1, 1000000000)
+        # column metadata is shared by every instance, see `definition()`
+        definition = self.definition()
+        self.column_defs = definition.column_defs
+        self.additional_cols = definition.additional_cols
+        self.required_cols = definition.required_cols
+        self.include_index = definition.include_index
         self.logger = logger
         self.max_limit = max_limit
         self.smart_search = smart_search
+        self.word_match = word_match
+        self.max_search_words = max_search_words
+        self.pagination = pagination
+        self.count_strategy = count_strategy
+        self.count_provider = count_provider or ExactCount()
+        self.strict_ordering = strict_ordering
+        self.export_chunk_size = export_chunk_size
+        self.projection = projection
+        self.result_cache = result_cache
+        self.slow_threshold_ms = slow_threshold_ms
+        self.debug_sql = debug_sql
+        self.offload = offload
+        self.max_concurrency = max_concurrency
         self.option: DataTableOption = DataTableOption(**kwargs)
         self.session: Optional[Session] = None
 
         # state
-        self.column_defs: Dict[str, DataTableColumn] = {
-            column.data.key: column
-            for column in self.get_columns()
-        }
-        self.modified_datatable()
         self.query_statement: Optional[SQLQuery] = None
+        self.filtered_statement: Optional[SQLQuery] = None
+        self.windowed = False
 
         # result
         self.prepared = False
         self.total_record: Optional[int] = None
         self.filtered_record: Optional[int] = None
+        self.next_cursor: Optional[str] = None
+        self.prev_cursor: Optional[str] = None
+        self.has_more: Optional[bool] = None
+        # milliseconds spent in each rendering phase
+        self.timings: Dict[str, float] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if getattr(cls.get_columns, "__isabstractmethod__", False):
+            return
+
+        # the index is maintained by every write of the model, whether this datatable is imported or not
+        for column in cls.get_columns():
+            if column.search == SearchMode.NGRAM and isinstance(column.data, InstrumentedAttribute):
+                if column.data.key not in ngram_columns(column.data.class_):
+                    raise ValueError(
+                        f"`{cls.__name__}` searches `{column.data}` by n-gram, declare the index on the model: "
+                        f"`Column(..., info={{'{NGRAM_INFO_KEY}': True}})`"
+                    )
+
+    @classmethod
+    def definition(cls) -> DataTableDefinition:
+        definition = cls.__dict__.get("_definition")
+        if definition is None:
+            with _definitions_lock:
+                definition = cls.__dict__.get("_definition")
+                if definition is None:
+                    definition = cls._compile_definition()
+                    cls._definition = definition
+        return definition
+
+    @classmethod
+    def _compile_definition(cls) -> DataTableDefinition:
+        """
+        Run `get_columns()` and `modified_datatable()` on a bare instance, without any request state.
+        Closures given to `add_column`/`filter_column` are shared by every request, so they must only
+        use their arguments, never per-request attributes of `self` (`session`, `option`), batch producers
+        get the request-bound datatable for that.
+        """
+        builder = cls.__new__(cls)
+        ModifiedDatatableAction.__init__(builder)
+        builder.column_defs = {column.name: column for column in cls.get_columns()}
+        builder.modified_datatable()
+
+        columns = list(builder.column_defs.values())
+        return DataTableDefinition(
+            column_defs=builder.column_defs,
+            additional_cols=builder.additional_cols,
+            required_cols=builder.required_cols,
+            include_index=builder.include_index,
+            searchable_columns=[column for column in columns if column.searchable],
+            exportable_columns=[column for column in columns if column.exportable],
+        )
 
     @staticmethod
     @abc.abstractmethod
@@ -157,51 +674,288 @@ class BaseDataTable(ModifiedDatatableAction):
     def modified_datatable(self):
         raise NotImplementedError
 
+    def keyset_column(self) -> InstrumentedAttribute:
+        """
+        Column used to seek in keyset pagination mode. It must be orderable, unique and indexed,
+        by default the first orderable primary key column is used.
+        """
+        for column in self.column_defs.values():
+            if column.orderable and isinstance(column.data, InstrumentedAttribute) and column.data.primary_key:
+                return column.data
+
+        raise ValueError(f"`{self.__class__.__name__}` has no orderable primary key column for keyset pagination!")
+
     async def render(self, db: Session, response: Response, extra: Dict = None) -> Any:
         # before call action
         self.session = db
-        self.query_statement = self.query()
+        self.query_statement = self._project(self.query())
 
         # call action and get result
         if self.option.action == Action.AJAX:
-            result = await self._call_ajax(
-                response=response,
-                extra=extra
-            )
+            capture = SQLCapture(db) if self.debug_sql else None
+            try:
+                with self._timed("total"):
+                    result = await self._call_ajax(
+                        response=response,
+                        extra=extra
+                    )
+            finally:
+                if capture is not None:
+                    capture.stop()
+            if capture is not None:
+                debug = await self._run_blocking(capture.explain)
+                result["data"]["others"] = {**result["data"]["others"], "debug": debug}
+            self._report_timings(response)
+        elif self.option.action in (Action.CSV, Action.EXCEL):
+            result = self._call_export()
         else:
             result = []
 
         # after call action, clear init data
         self.session = None
         self.query_statement = None
+        self.filtered_statement = None
         return result
 
+    async def _run_blocking(self, func: Callable, *args) -> Any:
+        """
+        Run blocking database work in the threadpool, so a slow listing doesn't freeze the event loop.
+        At most `max_concurrency` renders of this datatable class hold a worker thread at once.
+        """
+        if not self.offload:
+            return func(*args)
+
+        key = (self.__class__, self.max_concurrency)
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters.setdefault(key, CapacityLimiter(self.max_concurrency))
+        return await anyio.to_thread.run_sync(partial(func, *args), limiter=limiter)
+
+    @contextmanager
+    def _timed(self, phase: str) -> Generator:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0) + (time.perf_counter() - start) * 1000
+
+    def _report_timings(self, response: Response):
+        response.headers["Server-Timing"] = ", ".join(
+            f"dt-{phase};dur={duration:.2f}" for phase, duration in self.timings.items()
+        )
+        total = self.timings.get("total", 0)
+        if self.slow_threshold_ms is not None and total >= self.slow_threshold_ms:
+            phases = ", ".join(f"{phase}={duration:.1f}ms" for phase, duration in self.timings.items())
+            self.logger.warning(f"{self.__class__.__name__}: slow render ({phases}), option: {self._describe_option()}")
+
+    def _describe_option(self) -> str:
+        option = self.option
+        return f"keyword={option.keyword!r} page={option.page} limit={option.limit} sort={option.sort!r}"
+
+    def _project(self, query: SQLQuery) -> SQLQuery:
+        if self.projection == Projection.ENTITY:
+            return query
+        return query.with_entities(*self._projection_columns(query))
+
+    def _projection_columns(self, query: SQLQuery) -> List[Any]:
+        columns: Dict[str, Any] = {}
+        for column in self.column_defs.values():
+            if isinstance(column.data, InstrumentedAttribute):
+                columns.setdefault(column.data.key, column.data)
+        for column in self.required_cols:
+            columns.setdefault(column.key, column)
+
+        for model in query_models(query)[:1]:
+            for attribute in inspect(model).column_attrs:
+                is_large = isinstance(attribute.columns[0].type, (Text, LargeBinary, JSON))
+                if attribute.columns[0].primary_key or (self.projection == Projection.SCALAR and not is_large):
+                    columns.setdefault(attribute.key, getattr(model, attribute.key))
+
+        return list(columns.values())
+
+    def _hydrate(self, rows: List[Any]) -> List[Any]:
+        if self.projection == Projection.ENTITY:
+            return [row[0] for row in rows] if self.windowed else rows
+
+        return [
+            DataTableRecord(**{key: value for key, value in row._asdict().items() if key != WINDOW_COUNT_LABEL})
+            for row in rows
+        ]
+
+    def models(self) -> Set[Type]:
+        """
+        Models read by the datatable, writes to them invalidate its result cache.
+        """
+        columns = [column.data for column in self.column_defs.values()
+                   if isinstance(column.data, InstrumentedAttribute)]
+        return {column.class_ for column in columns + self.required_cols}
+
+    def cache_scope(self) -> Hashable:
+        """
+        Part of the result cache key identifying the caller, override it when `query()` depends on the caller.
+        """
+        return None
+
     async def _call_ajax(self, response: Response, extra: Dict = None) -> Dict:
         try:
-            self._prepare_query()
-            result = await self._results()
-            result = await self._process_result(result)
-            return self._render_result(result, response=response, extra=extra)
+            if self.result_cache is not None:
+                return await self._call_cached_ajax(response=response, extra=extra)
+
+            await self._run_blocking(self._prepare_query)
+            with self._timed("results"):
+                result = await self._run_blocking(self._results)
+            with self._timed("process"):
+                result = await self._process_result(result)
+            with self._timed("render"):
+                return self._render_result(result, response=response, extra=extra)
+        except VHTTPException:
+            raise
         except Exception as e:
             LOGGER.error(str(e))
             raise BadPayloadException(
                 message=f"Error when querying data!"
             )
 
+    async def _call_cached_ajax(self, response: Response, extra: Dict = None) -> Dict:
+        with self._timed("cache"):
+            data = self.result_cache.get(self)
+        if data is not None:
+            response.headers["X-Cache"] = "HIT"
+        else:
+            response.headers["X-Cache"] = "MISS"
+            generation = self.result_cache.generation(self.__class__)
+            await self._run_blocking(self._prepare_query)
+            with self._timed("results"):
+                result = await self._run_blocking(self._results)
+            with self._timed("process"):
+                result = await self._process_result(result)
+            with self._timed("render"):
+                data = self._result_data([self._snapshot(record) for record in result])
+            self.result_cache.set(self, data, generation)
+
+        return success_response(
+            response=response,
+            data={**data, "others": extra or {}},
+            message=""
+        )
+
+    def _snapshot(self, record: Any) -> Dict[str, Any]:
+        """
+        Plain copy of a record, cached pages must not hold session bound instances.
+        """
+        if isinstance(record, DataTableRecord):
+            return dict(vars(record))
+
+        values = {attribute.key: getattr(record, attribute.key) for attribute in inspect(record).mapper.column_attrs}
+        names = [column_name for column_name, _ in self.additional_cols]
+        if self.include_index[0]:
+            names.append(self.include_index[1])
+        values.update({name: getattr(record, name) for name in names})
+        return values
+
+    def _call_export(self) -> StreamingResponse:
+        self._filter_records()
+        if self.pagination == Pagination.KEYSET:
+            self.query_statement = self.query_statement.order_by(self.keyset_column().asc())
+        else:
+            self.ordering()
+
+        # Excel needs the BOM to read the CSV as UTF-8
+        excel = self.option.action == Action.EXCEL
+        return StreamingResponse(
+            self._export_rows(self.query_statement, self.session, bom=excel),
+            media_type="application/vnd.ms-excel" if excel else "text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{self.export_filename()}.csv"'},
+        )
+
+    def export_filename(self) -> str:
+        return underscore(self.__class__.__name__)
+
+    def _exportable_columns(self) -> List[DataTableColumn]:
+        return self.definition().exportable_columns
+
+    async def _export_rows(self, query: SQLQuery, session: Session, bom: bool = False) -> AsyncIterator[str]:
+        """
+        Stream rows through a server side cursor, so memory stays flat whatever the number of rows.
+        Chunks are fetched in the threadpool, column producers run on the event loop.
+        """
+        columns = self._exportable_columns()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if bom:
+            buffer.write("\ufeff")
+        writer.writerow([column.title for column in columns])
+        yield self._flush_buffer(buffer)
+
+        # `render()` returned before the response streams, batch producers still reach the session
+        self.session = session
+        # an unbuffered cursor holds its connection until exhausted, a query of a batch producer on that
+        # connection would silently discard the rest of the rows (pymysql): rows stream on a session of their own
+        cursor_session = Session(bind=session.get_bind(clause=query.statement))
+        try:
+            # iterating a query executes it, the cursor is opened in the threadpool like chunks are fetched
+            rows = await self._run_blocking(self._open_cursor, query.with_session(cursor_session))
+            while True:
+                chunk = await self._run_blocking(self._next_chunk, rows)
+                if not chunk:
+                    break
+
+                records = self._hydrate(chunk)
+                await self._add_columns(records)
+                yield self._export_chunk(records, columns, writer, buffer, cursor_session)
+        except Exception as e:
+            # headers are already sent, the client only sees a truncated file
+            LOGGER.error(str(e))
+            raise
+        finally:
+            self.session = None
+            await self._run_blocking(cursor_session.close)
+
+    def _open_cursor(self, query: SQLQuery) -> Iterator[Any]:
+        return iter(query.execution_options(stream_results=True).yield_per(self.export_chunk_size))
+
+    def _next_chunk(self, rows: Iterator[Any]) -> List[Any]:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.export_chunk_size:
+                break
+        return chunk
+
+    def _export_chunk(self, records: List[Any], columns: List[DataTableColumn], writer, buffer: io.StringIO,
+                      session: Session) -> str:
+        for record in records:
+            writer.writerow([getattr(record, column.name, None) for column in columns])
+            if self.projection == Projection.ENTITY and record in session:
+                session.expunge(record)
+        return self._flush_buffer(buffer)
+
+    @staticmethod
+    def _flush_buffer(buffer: io.StringIO) -> str:
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
     def _prepare_query(self):
         if not self.prepared:
-            self.total_record = self._count_total()
+            if self.option.count:
+                with self._timed("count"):
+                    self.total_record = self._count_total()
 
-            if self.total_record:
-                self._filter_records()
-                # self.ordering()
-                self._paginate()
+            if self.total_record or not self.option.count:
+                with self._timed("filter"):
+                    self._filter_records()
+                    self.ordering()
+                    self._paginate()
+            else:
+                self.filtered_record = 0
 
         self.prepared = True
 
     def _count_total(self) -> int:
         if self.total_record is None:
-            return self._count()
+            return self.count_provider.count(self)
 
         return self.total_record
 
@@ -212,73 +966,328 @@ class BaseDataTable(ModifiedDatatableAction):
         return self.query_statement
 
     def _filter_records(self):
-        if self.smart_search:
-            return self._do_smart_search()
+        self._do_search(self._search_keywords())
 
-        return self._do_search([self.option.keyword])
+        if self.filtered_statement is None:
+            # nothing was filtered, so filtered records are total records
+            self.filtered_record = self.total_record
 
-    def _do_smart_search(self):
-        keywords = self.option.keyword.split(" ")
-        keywords = list(filter(lambda x: x != "", keywords))
-        return self._do_search(keywords)
+    def _search_keywords(self) -> List[str]:
+        keyword = self.option.keyword
+        if not self.smart_search:
+            return [keyword] if keyword != "" else []
+        # extra words are dropped, each word adds a group of conditions to the query
+        return list(dict.fromkeys(keyword.split()))[:self.max_search_words]
 
     def _do_search(self, keywords: List[str]):
-        keywords = list(set(keywords))
-        searchable_cols = self._searchable_columns()
-        filter_conditions = []
-        for keyword in keywords:
-            if keyword == "":
+        if not keywords:
+            return
+
+        matchers, fulltext_cols = self._search_plan(self.session.get_bind().dialect.name)
+        if not matchers and not fulltext_cols:
+            return
+
+        if self.word_match == WordMatch.ANY:
+            conditions = [matcher(keyword) for keyword in keywords for matcher in matchers]
+            if fulltext_cols:
+                conditions.extend(self._fulltext_conditions(fulltext_cols, keywords))
+            condition = or_(*conditions)
+        elif not matchers:
+            # a single MATCH with every word required serves all words from the FULLTEXT index
+            condition = and_(*self._fulltext_conditions(fulltext_cols, keywords, required=True))
+        else:
+            condition = and_(*(self._word_condition(matchers, fulltext_cols, keyword) for keyword in keywords))
+
+        self.query_statement = self.query_statement.filter(condition)
+        self.filtered_statement = self.query_statement
+
+    def _search_plan(self, dialect: str) -> Tuple[List[Matcher], List[InstrumentedAttribute]]:
+        """
+        Matchers of the searchable columns and the fulltext columns, built once per datatable class and dialect.
+        """
+        search_plans = self.definition().search_plans
+        if dialect in search_plans:
+            return search_plans[dialect]
+
+        matchers = []
+        fulltext_cols = []
+        for column in self._searchable_columns():
+            if column.filter:
+                matchers.append(column.filter)
+            elif not isinstance(column.data, InstrumentedAttribute):
                 continue
-            for column in searchable_cols:
-                if column.filter:
-                    if keyword:
-                        filter_conditions.append(column.filter(keyword))
+            elif column.search == SearchMode.FULLTEXT and dialect == "mysql":
+                fulltext_cols.append(column.data)
+            else:
+                matchers.append(self._column_matcher(column, dialect))
+
+        search_plans[dialect] = (matchers, fulltext_cols)
+        return search_plans[dialect]
+
+    def _word_condition(
+            self,
+            matchers: List[Matcher],
+            fulltext_cols: List[InstrumentedAttribute],
+            keyword: str,
+    ) -> Any:
+        conditions = [matcher(keyword) for matcher in matchers]
+        if fulltext_cols:
+            conditions.extend(self._fulltext_conditions(fulltext_cols, [keyword]))
+        return or_(*conditions)
+
+    @staticmethod
+    def _column_matcher(column: DataTableColumn, dialect: str) -> Matcher:
+        """
+        Resolve the search mode of a column once, the matcher builds the condition of a single word.
+        """
+        if column.search == SearchMode.PREFIX:
+            return lambda keyword: prefix_condition(column.data, keyword, dialect)
+        if column.search == SearchMode.NGRAM:
+            return partial(ngram_condition, column.data)
+        return partial(substring_condition, column.data)
+
+    @staticmethod
+    def _fulltext_conditions(
+            columns: List[InstrumentedAttribute],
+            keywords: List[str],
+            required: bool = False,
+    ) -> List[Any]:
+        """
+        Any of the returned conditions matches one of `keywords`, or all of them must match with `required`.
+        Words shorter than the indexed token size fall back to substring conditions.
+        """
+        # the MATCH column list must be the same as the FULLTEXT index, so all columns are matched at once
+        conditions = []
+        indexed = [keyword for keyword in keywords if len(keyword) >= FULLTEXT_MIN_TOKEN_SIZE]
+        if indexed:
+            conditions.append(fulltext_condition(columns, indexed, required=required))
+        for keyword in keywords:
+            if len(keyword) < FULLTEXT_MIN_TOKEN_SIZE:
+                short = [substring_condition(column, keyword) for column in columns]
+                if required:
+                    conditions.append(or_(*short))
                 else:
-                    if keyword and isinstance(column.data, InstrumentedAttribute):
-                        filter_conditions.append(column.data.ilike(f'%{keyword}%'))
-        if len(filter_conditions) > 0:
-            self.query_statement = self.query_statement.filter(or_(*filter_conditions))
+                    conditions.extend(short)
+        return conditions
 
     def _searchable_columns(self) -> List[DataTableColumn]:
-        return list(filter(lambda col: col.searchable, list(self.column_defs.values())))
+        return self.definition().searchable_columns
+
+    def ordering(self):
+        sorts = self._parse_sort()
+        if self.pagination == Pagination.KEYSET:
+            # keyset pages are always ordered by the keyset column, see `_seek`
+            keyset_key = self.keyset_column().key
+            if any(column.data.key != keyset_key or descending for column, descending in sorts):
+                raise BadPayloadException(
+                    message=f"Invalid `sort` params! Only `{keyset_key}` is allowed in keyset pagination!",
+                )
+            return
+
+        order_by = [column.data.desc() if descending else column.data.asc() for column, descending in sorts]
+        # tie-breaker on primary key, rows with the same sort values must keep the same order across pages
+        sorted_keys = {column.data.key for column, _ in sorts}
+        for model in query_models(self.query_statement)[:1]:
+            for pk_column in inspect(model).primary_key:
+                if pk_column.key not in sorted_keys:
+                    order_by.append(pk_column.asc())
+
+        if order_by:
+            self.query_statement = self.query_statement.order_by(*order_by)
+
+    def _parse_sort(self) -> List[Tuple[DataTableColumn, bool]]:
+        """
+        Parse `sort` params like `-created_at,id`, a `-` prefix means descending.
+        """
+        sorts: List[Tuple[DataTableColumn, bool]] = []
+        for item in (self.option.sort or "").split(","):
+            item = item.strip()
+            if item == "":
+                continue
+
+            descending = item.startswith("-")
+            name = item.lstrip("-+").strip()
+            column = self.column_defs.get(name)
+            if column is None or not column.orderable or not isinstance(column.data, InstrumentedAttribute):
+                raise BadPayloadException(message=f"Invalid `sort` params! Column `{name}` is not orderable!")
+            if any(sorted_column is column for sorted_column, _ in sorts):
+                raise BadPayloadException(message=f"Invalid `sort` params! Column `{name}` is duplicated!")
+
+            self._check_sort_index(column)
+            sorts.append((column, descending))
+
+        return sorts
+
+    def _check_sort_index(self, column: DataTableColumn):
+        if is_indexed(column.data):
+            return
+
+        name = column.data.key
+        if self.strict_ordering:
+            raise BadPayloadException(message=f"Invalid `sort` params! Column `{name}` has no index to sort by!")
+
+        if (self.__class__, name) not in _unindexed_sort_warned:
+            _unindexed_sort_warned.add((self.__class__, name))
+            self.logger.warning(f"{self.__class__.__name__}: sorting by `{name}` without a supporting index")
 
     def _paginate(self):
+        if self.pagination == Pagination.KEYSET:
+            return self._seek()
+
+        if self.option.count and self.filtered_record is None:
+            if self._resolve_count_strategy() == CountStrategy.WINDOW:
+                self.query_statement = self.query_statement.add_columns(
+                    func.count().over().label(WINDOW_COUNT_LABEL)
+                )
+                self.windowed = True
+            else:
+                self.filtered_record = self._count_filtered()
+
         offset = self._start_index
         if offset > 0:
             self.query_statement = self.query_statement.offset(offset)
-        self.query_statement = self.query_statement.limit(self.option.limit)
+        # without counting, fetch one extra row to know whether there is a next page
+        self.query_statement = self.query_statement.limit(self.option.limit + (0 if self.option.count else 1))
+
+    def _seek(self):
+        # filtered total must be counted before the seek condition narrows the query
+        if self.option.count and self.filtered_record is None:
+            self.filtered_record = self._count_filtered()
 
-    async def _results(self) -> List[Any]:
-        self.filtered_record = self.query_statement.count()
-        return self.query_statement.all()
+        column = self.keyset_column()
+        condition: Optional[ColumnElement] = None
+        if self.option.before is not None:
+            condition = column < decode_cursor(self.option.before)
+            ordering = column.desc()
+        else:
+            if self.option.after is not None:
+                condition = column > decode_cursor(self.option.after)
+            ordering = column.asc()
+
+        if condition is not None:
+            self.query_statement = self.query_statement.filter(condition)
+        # fetch one extra row to know whether there is another page in this direction
+        self.query_statement = self.query_statement.order_by(ordering).limit(self.option.limit + 1)
+
+    def _set_cursors(self, records: List[Any]) -> List[Any]:
+        has_more = len(records) > self.option.limit
+        records = records[:self.option.limit]
+        backward = self.option.before is not None
+        if backward:
+            records.reverse()
+
+        if records:
+            key = self.keyset_column().key
+            first, last = getattr(records[0], key), getattr(records[-1], key)
+            # coming back from a `before` cursor means there is always a next page
+            if has_more or backward:
+                self.next_cursor = encode_cursor(last)
+            if (has_more and backward) or self.option.after is not None:
+                self.prev_cursor = encode_cursor(first)
+
+        self.has_more = self.next_cursor is not None
+        return records
+
+    def _count_filtered(self) -> int:
+        return self.filtered_statement.count()
+
+    def _resolve_count_strategy(self) -> CountStrategy:
+        if self.count_strategy != CountStrategy.AUTO:
+            return self.count_strategy
+
+        dialect = self.session.get_bind().dialect
+        version = dialect.server_version_info or ()
+        if dialect.name == "mysql":
+            supported = version >= ((10, 2) if getattr(dialect, "is_mariadb", False) else (8, 0))
+        elif dialect.name == "sqlite":
+            supported = version >= (3, 25)
+        else:
+            supported = dialect.name in ("postgresql", "mssql", "oracle")
+
+        return CountStrategy.WINDOW if supported else CountStrategy.SEPARATE
+
+    def _unpack_window(self, rows: List[Any]):
+        if rows:
+            self.filtered_record = rows[0][-1]
+        elif self._start_index == 0:
+            self.filtered_record = 0
+        else:
+            # page is out of range, window column can't tell the total
+            self.filtered_record = self._count_filtered()
+
+    def _results(self) -> List[Any]:
+        if self.total_record == 0:
+            return []
+
+        rows = self.query_statement.all()
+        if self.windowed:
+            self._unpack_window(rows)
+        records = self._hydrate(rows)
+
+        if self.pagination == Pagination.KEYSET:
+            return self._set_cursors(records)
+
+        if not self.option.count:
+            self.has_more = len(records) > self.option.limit
+            records = records[:self.option.limit]
+
+        return records
 
     def _render_result(self, result, response: Response, extra: Dict = None):
         if extra is None:
             extra = {}
         return success_response(
             response=response,
-            data={
-                "totalRecords": self.total_record,
-                "filteredRecords": self.filtered_record,
-                "items": result,
-                "others": extra
-            },
+            data={**self._result_data(result), "others": extra},
             message=""
         )
 
+    def _result_data(self, result: List[Any]) -> Dict[str, Any]:
+        return {
+            "totalRecords": self.total_record,
+            "filteredRecords": self.filtered_record,
+            "items": result,
+            "nextCursor": self.next_cursor,
+            "prevCursor": self.prev_cursor,
+            "hasMore": self.has_more,
+        }
+
     async def _process_result(self, records: List):
-        start = self._start_index
-        for record in records:
-            await self._add_column(record)
-            if self.include_index[0]:
-                start += 1
-                setattr(record, self.include_index[1], start)
+        await self._add_columns(records)
+        if self.include_index[0]:
+            keyset = self.pagination == Pagination.KEYSET
+            for index, record in enumerate(records, start=self._start_index + 1):
+                setattr(record, self.include_index[1], None if keyset else index)
 
         return records
 
-    async def _add_column(self, record):
+    async def _add_columns(self, records: List[Any]):
+        if not records or not self.additional_cols:
+            return
+
+        # sync producers may query the database too, run them off the event loop
+        pending = await self._run_blocking(self._run_sync_producers, records)
+        if pending:
+            results = await asyncio.gather(*(values for _, values in pending))
+            for (column_name, _), values in zip(pending, results):
+                self._set_column_values(records, column_name, values)
+
+    def _run_sync_producers(self, records: List[Any]) -> List[Tuple[str, Any]]:
+        pending: List[Tuple[str, Any]] = []
         for column_name, producer in self.additional_cols:
-            value = producer(record)
+            values = producer(records, self)
+            if isawaitable(values):
+                pending.append((column_name, values,))
+            else:
+                self._set_column_values(records, column_name, values)
+        return pending
+
+    @staticmethod
+    def _set_column_values(records: List[Any], column_name: str, values: Sequence[Any]):
+        if len(values) != len(records):
+            raise ValueError(f"Producer of `{column_name}` returned {len(values)} values for {len(records)} records")
+
+        for record, value in zip(records, values):
             setattr(record, column_name, value)
 
     @property
@@ -292,13 +1301,40 @@ class UseDatatable:
             base_cls: Type[BaseDataTable],
             max_limit: int = DEFAULT_LIMIT,
             smart_search: bool = True,
+            word_match: WordMatch = WordMatch.ALL,
+            max_search_words: int = MAX_SEARCH_WORDS,
+            max_keyword_length: int = MAX_KEYWORD_LENGTH,
             logger: Logger = local_logger,
+            pagination: Pagination = Pagination.OFFSET,
+            count_strategy: CountStrategy = CountStrategy.AUTO,
+            count_provider: CountProvider = None,
+            strict_ordering: bool = False,
+            projection: Projection = Projection.ENTITY,
+            result_cache: DataTableCache = None,
+            slow_threshold_ms: Optional[float] = SLOW_THRESHOLD_MS,
+            debug_sql: bool = False,
+            offload: bool = True,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
             **kwargs
     ):
         self.base_cls = base_cls
         self.max_limit = max_limit
         self.smart_search = smart_search
+        self.word_match = word_match
+        self.max_search_words = max_search_words
+        self.max_keyword_length = max_keyword_length
         self.logger = logger
+        self.pagination = pagination
+        self.count_strategy = count_strategy
+        # shared across requests, so cached/tracked counts outlive a single datatable instance
+        self.count_provider = count_provider or ExactCount()
+        self.strict_ordering = strict_ordering
+        self.projection = projection
+        self.result_cache = result_cache
+        self.slow_threshold_ms = slow_threshold_ms
+        self.debug_sql = debug_sql
+        self.offload = offload
+        self.max_concurrency = max_concurrency
         self.config = kwargs
 
     def __call__(
@@ -307,20 +1343,51 @@ class UseDatatable:
             k: Optional[str] = Query(description="keyword for searching", default=""),
             p: Optional[int] = Query(description="Page", default=1, ge=1),
             ipp: Optional[int] = Query(description="Limit", default=DEFAULT_LIMIT, gt=0),
-            action: Optional[Action] = Query(description="Action Type", default=Action.AJAX)
+            action: Optional[Action] = Query(description="Action Type", default=Action.AJAX),
+            after: Optional[str] = Query(description="Cursor of the next page (keyset mode)", default=None),
+            before: Optional[str] = Query(description="Cursor of the previous page (keyset mode)", default=None),
+            count: bool = Query(description="Count total records, `false` only returns `hasMore`", default=True),
+            sort: Optional[str] = Query(
+                description="Comma separated orderable columns, prefix `-` for descending, e.g. `-id,email`",
+                default=None,
+            ),
     ) -> BaseDataTable:
         if ipp > self.max_limit:
             raise BadPayloadException(
                 message="Invalid `limit` params! Reach max limit!",
             )
+        if len(k) > self.max_keyword_length:
+            raise BadPayloadException(
+                message=f"Invalid `k` params! Keyword is longer than {self.max_keyword_length} characters!",
+            )
+        if after is not None and before is not None:
+            raise BadPayloadException(
+                message="Invalid `cursor` params! Only one of `after` and `before` is allowed!",
+            )
         return self.base_cls(
             max_limit=self.max_limit,
             smart_search=self.smart_search,
+            word_match=self.word_match,
+            max_search_words=self.max_search_words,
             logger=self.logger,
+            pagination=self.pagination,
+            count_strategy=self.count_strategy,
+            count_provider=self.count_provider,
+            strict_ordering=self.strict_ordering,
+            projection=self.projection,
+            result_cache=self.result_cache,
+            slow_threshold_ms=self.slow_threshold_ms,
+            debug_sql=self.debug_sql,
+            offload=self.offload,
+            max_concurrency=self.max_concurrency,
             request=request,
             keyword=k.lower(),
             page=p,
             limit=ipp,
             action=action,
+            after=after,
+            before=before,
+            count=count,
+            sort=sort,
             **self.config
         )
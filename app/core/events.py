@@ -0,0 +1,40 @@
+from collections import defaultdict
+from enum import Enum
+from typing import Any, Callable, DefaultDict, List, Type
+
+from app.core.logger import LOGGER
+
+
+class WriteAction(str, Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    REMOVE = "remove"
+
+
+# listener(model, action, obj), `obj` is None when the write touched an unknown set of rows
+ModelWriteListener = Callable[[Type, WriteAction, Any], None]
+
+_listeners: DefaultDict[Type, List[ModelWriteListener]] = defaultdict(list)
+
+
+def on_model_write(model: Type, listener: ModelWriteListener):
+    """
+    Register a listener called after a repository writes to `model` (or any subclass of it).
+    """
+    if listener not in _listeners[model]:
+        _listeners[model].append(listener)
+
+
+def remove_model_write_listener(model: Type, listener: ModelWriteListener):
+    if listener in _listeners[model]:
+        _listeners[model].remove(listener)
+
+
+def dispatch_model_write(model: Type, action: WriteAction, obj: Any = None):
+    for cls in model.__mro__:
+        for listener in list(_listeners.get(cls, [])):
+            try:
+                listener(model, action, obj)
+            except Exception as e:
+                # a broken listener must never fail the write itself
+                LOGGER.error(str(e))
@@ -1,18 +1,25 @@
-from typing import Any, Dict, Union
+from typing import Any, Dict, FrozenSet, Union
 
 from inflection import underscore, pluralize
 from pydantic import BaseModel
-from sqlalchemy import Column, DateTime, func, inspect
+from sqlalchemy import Column, DateTime, event, func, inspect
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
 
+# `InstanceState.info` key of the origins of the written changes, a reloaded instance starts without them
+ORIGINS_KEY = "origins"
 
-class ModelHelper:
-    def __init__(self):
-        self.v_dirty_columns: Dict[str, Any] = {}
 
-    @declared_attr
-    def v_dirty_columns(self) -> Dict[str, Any]:
-        return {}
+class ModelHelper:
+    @classmethod
+    def column_keys(cls) -> FrozenSet[str]:
+        """
+        Keys of the mapped columns, resolved once per class.
+        """
+        keys = cls.__dict__.get("_column_keys")
+        if keys is None:
+            keys = frozenset(attribute.key for attribute in inspect(cls).column_attrs)
+            cls._column_keys = keys
+        return keys
 
     def columns(self):
         return inspect(self.__class__).c
@@ -25,34 +32,42 @@ class ModelHelper:
                 setattr(self, field, value)
 
     def is_dirty(self, colum_name: str = None) -> bool:
+        """
+        Changed since the instance was created or loaded, flushes and commits don't reset it.
+        """
+        state = inspect(self)
+        origins = state.info.get(ORIGINS_KEY, {})
         if colum_name:
-            return colum_name in self.v_dirty_columns
+            return colum_name in self.column_keys() and (
+                colum_name in origins or state.attrs[colum_name].history.has_changes()
+            )
 
-        return len(self.v_dirty_columns.keys()) > 0
+        return bool(origins) or any(state.attrs[key].history.has_changes() for key in self.column_keys())
 
     def get_origin(self, column_name: str) -> Any:
-        if column_name in self.v_dirty_columns:
-            return self.v_dirty_columns[column_name]
-
-        if column_name in self.columns():
-            return getattr(self, column_name)
-
-        raise ValueError(f"Column `{column_name}` not found in `{self.__class__}`")
-
-    def __setattr__(self, key, value):
-        if hasattr(self, 'v_dirty_columns'):
-            try:
-                origin_value = getattr(self, key)
-            except AttributeError:
-                origin_value = None
-
-            new_value = value
-            is_changed = new_value != origin_value
-            is_column = key in self.columns()
-            if is_column and is_changed:
-                self.v_dirty_columns[key] = origin_value
-
-        super().__setattr__(key, value)
+        if column_name not in self.column_keys():
+            raise ValueError(f"Column `{column_name}` not found in `{self.__class__}`")
+
+        state = inspect(self)
+        origins = state.info.get(ORIGINS_KEY, {})
+        if column_name in origins:
+            return origins[column_name]
+        history = state.attrs[column_name].history
+        if history.has_changes():
+            # nothing deleted: the old value was never loaded (new or expired instance)
+            return history.deleted[0] if history.deleted else None
+        return getattr(self, column_name)
+
+    def remember_changes(self):
+        """
+        Keep the origins of the pending changes before they are written, the attribute history forgets them.
+        """
+        state = inspect(self)
+        origins = state.info.setdefault(ORIGINS_KEY, {})
+        for key in self.column_keys():
+            history = state.attrs[key].history
+            if history.has_changes() and key not in origins:
+                origins[key] = history.deleted[0] if history.deleted else None
 
 
 @as_declarative()
@@ -63,7 +78,6 @@ class Base(ModelHelper):
     def __init__(self, **kwargs):
         for k, v in kwargs.items():
             setattr(self, k, v)
-        super().__init__()
 
     # Generate __tablename__ automatically
     @declared_attr
@@ -82,6 +96,12 @@ class Base(ModelHelper):
                       default=func.now(), nullable=False, onupdate=func.now())
 
 
+@event.listens_for(Base, "before_insert", propagate=True)
+@event.listens_for(Base, "before_update", propagate=True)
+def _remember_flushed_changes(mapper: Any, connection: Any, target: Base):
+    target.remember_changes()
+
+
 class AuthenticatableModel:
     id: Any
     password: Any
@@ -0,0 +1,142 @@
+from collections import defaultdict
+from typing import Any, DefaultDict, Dict, Iterable, List, Set, Tuple, Type
+
+from sqlalchemy import distinct, func, inspect, insert, select
+from sqlalchemy.orm import Session
+
+from app.core.model import Base
+from app.core.search import substring_condition
+from app.models.search_ngram import SearchNgram
+
+NGRAM_SIZE = 3
+# `Column(..., info={NGRAM_INFO_KEY: True})` declares a n-gram side index on the column
+NGRAM_INFO_KEY = "ngram"
+
+# model -> names of the columns declaring a n-gram side index, read once from the mapper
+_ngram_columns: Dict[Type, Set[str]] = {}
+
+
+def ngrams(value: Any, size: int = NGRAM_SIZE) -> Set[str]:
+    if value is None:
+        return set()
+    value = str(value).lower()
+    return {value[i:i + size] for i in range(len(value) - size + 1)}
+
+
+def ngram_columns(model: Type) -> Set[str]:
+    columns = _ngram_columns.get(model)
+    if columns is None:
+        columns = {
+            attribute.key
+            for attribute in inspect(model).column_attrs
+            if any(column.info.get(NGRAM_INFO_KEY) for column in attribute.columns)
+        }
+        _ngram_columns[model] = columns
+    return columns
+
+
+def ngram_models() -> List[Type]:
+    """
+    Imported models declaring n-gram columns.
+    """
+    return [mapper.class_ for mapper in Base.registry.mappers if ngram_columns(mapper.class_)]
+
+
+def ngram_rows(obj: Any, columns: Iterable[str]) -> List[Dict[str, Any]]:
+    table_name = obj.__table__.name
+    return [
+        dict(table_name=table_name, column_name=column_name, record_id=obj.id, gram=gram)
+        for column_name in columns
+        for gram in ngrams(getattr(obj, column_name))
+    ]
+
+
+def index_record(db: Session, obj: Any):
+    """
+    Index the n-grams of the new `obj`, call it inside the transaction inserting `obj` (after a flush, so `obj.id`
+    is set). Written records are reindexed by `index_records`.
+    """
+    columns = ngram_columns(type(obj))
+    if not columns:
+        return
+
+    rows = ngram_rows(obj, columns)
+    if rows:
+        db.execute(insert(SearchNgram), rows)
+
+
+def index_records(db: Session, model: Type, records: List[Dict[str, Any]]):
+    """
+    Bulk variant of `index_record`, each record is a dict of `id` and the written column values.
+    Only the n-grams of the indexed columns present in a record are replaced.
+    """
+    columns = ngram_columns(model)
+    table_name = model.__table__.name
+    ids_by_columns: DefaultDict[Tuple[str, ...], List[Any]] = defaultdict(list)
+    for record in records:
+        names = tuple(sorted(columns.intersection(record)))
+        if names:
+            ids_by_columns[names].append(record["id"])
+    if not ids_by_columns:
+        return
+
+    for names, ids in ids_by_columns.items():
+        db.query(SearchNgram).filter(
+            SearchNgram.table_name == table_name,
+            SearchNgram.column_name.in_(names),
+            SearchNgram.record_id.in_(ids),
+        ).delete(synchronize_session=False)
+
+    rows = [
+        dict(table_name=table_name, column_name=column_name, record_id=record["id"], gram=gram)
+        for record in records
+        for column_name in columns.intersection(record)
+        for gram in ngrams(record[column_name])
+    ]
+    if rows:
+        db.execute(insert(SearchNgram), rows)
+
+
+def unindex_record(db: Session, model: Type, record_id: Any):
+    if not ngram_columns(model):
+        return
+
+    db.query(SearchNgram).filter(
+        SearchNgram.table_name == model.__table__.name,
+        SearchNgram.record_id == record_id,
+    ).delete(synchronize_session=False)
+
+
+def unindex_where(db: Session, model: Type, *filter_conditions):
+    if not ngram_columns(model):
+        return
+
+    record_ids = select(model.id).where(*filter_conditions)
+    db.query(SearchNgram).filter(
+        SearchNgram.table_name == model.__table__.name,
+        SearchNgram.record_id.in_(record_ids),
+    ).delete(synchronize_session=False)
+
+
+def ngram_condition(column: Any, keyword: str) -> Any:
+    """
+    `column` contains `keyword`: candidate rows come from the n-gram index, the substring condition
+    then only runs on them (all grams of a keyword are found in a row doesn't mean they are adjacent).
+    """
+    grams = ngrams(keyword)
+    if not grams:
+        # shorter than a gram, nothing to look up
+        return substring_condition(column, keyword)
+
+    primary_key = inspect(column.class_).primary_key[0]
+    candidates = (
+        select(SearchNgram.record_id)
+        .where(
+            SearchNgram.table_name == primary_key.table.name,
+            SearchNgram.column_name == column.key,
+            SearchNgram.gram.in_(grams),
+        )
+        .group_by(SearchNgram.record_id)
+        .having(func.count(distinct(SearchNgram.gram)) == len(grams))
+    )
+    return primary_key.in_(candidates) & substring_condition(column, keyword)
@@ -1,57 +1,368 @@
-import inspect
-from typing import Any, Dict, Generic, List, Optional, Type, Union
+import asyncio
+from typing import Any, Awaitable, Dict, Generic, Iterator, List, Optional, Sequence, Set, Tuple, Type, Union
 from typing import TypeVar
 
 from pydantic import BaseModel
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy import UniqueConstraint, and_, bindparam, delete, func, insert, inspect, literal, select, tuple_, update
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import InstrumentedAttribute, set_committed_value
+from sqlalchemy.sql import Select, Update
+from starlette.concurrency import run_in_threadpool
 
+from app.core.cache import CacheBackend
+from app.core.events import WriteAction, on_model_write
 from app.core.logger import LOGGER
+from app.core.ngram import index_record, index_records, ngram_columns, unindex_record, unindex_where
 from app.core.model import Base
+from app.core.response import ConflictException
+from app.core.unit_of_work import dispatch_after_commit, in_unit_of_work, run_after_commit
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+BULK_CHUNK_SIZE = 1000
+# defaulting to `now()`, see `BaseRepository._with_timestamps`
+TIMESTAMP_COLUMNS = ("created_at", "updated_at")
+# `InstanceState.info` flag of the objects built from the identity cache
+FROM_CACHE_KEY = "from_cache"
 
-class BaseRepository(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
-    def __init__(self, model: Type[ModelType]):
+
+def chunked(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def dirty_values(db_obj: Base) -> Dict[str, Any]:
+    attrs = inspect(db_obj).attrs
+    return {key: getattr(db_obj, key) for key in db_obj.column_keys() if attrs[key].history.has_changes()}
+
+
+def update_statement(db_obj: Base, changes: Dict[str, Any], dialect: Any, optimistic_lock: bool = False) -> Update:
+    """
+    UPDATE of only the `changes` of `db_obj`. `updated_at` is set by the database clock, like the `now()` server
+    defaults of `created_at`, and read back with RETURNING where the dialect supports it. Otherwise the caller
+    must expire it. The optimistic lock needs the `updated_at` the object was loaded with: an unloaded one
+    (new or expired object) would be read now, and always match.
+    """
+    table = db_obj.__table__
+    statement = update(table).where(table.c.id == db_obj.id)
+    if optimistic_lock:
+        if "updated_at" in inspect(db_obj).unloaded:
+            raise ValueError(f"`updated_at` of `{type(db_obj).__name__}` is not loaded, reload the object to lock it")
+        # someone else updated the row since it was loaded: no row matches
+        history = inspect(db_obj).attrs.updated_at.history
+        statement = statement.where(table.c.updated_at == (history.deleted or history.unchanged)[0])
+    if "updated_at" in table.c and "updated_at" not in changes:
+        statement = statement.values(updated_at=func.now())
+        if getattr(dialect, "full_returning", False):
+            statement = statement.returning(table.c.updated_at)
+    return statement.values(**changes)
+
+
+class BatchLoader(Generic[ModelType]):
+    """
+    DataLoader-style batcher bound to a session: `load(id)` calls awaited together (e.g. the async producers
+    of a datatable page, or an `asyncio.gather`) are resolved by a single `find_many`.
+    Results are cached for the life of the session, a request with `get_db`.
+    """
+
+    def __init__(self, repository: "BaseRepository", db: Session):
+        self.repository = repository
+        self.db = db
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._pending: List[Any] = []
+        # the event loop only keeps weak references to tasks, running dispatches are held here
+        self._tasks: Set[asyncio.Task] = set()
+
+    def load(self, id: Any) -> Awaitable[Optional[ModelType]]:
+        # a coroutine, so it can be created off the event loop (sync producers run in the threadpool)
+        return self._load(id)
+
+    async def load_many(self, ids: Sequence[Any]) -> List[Optional[ModelType]]:
+        return list(await asyncio.gather(*(self._load(id) for id in ids)))
+
+    def clear(self, id: Any = None):
+        if id is None:
+            self._futures.clear()
+        else:
+            self._futures.pop(str(id), None)
+
+    async def _load(self, id: Any) -> Optional[ModelType]:
+        future = self._futures.get(str(id))
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._futures[str(id)] = future
+            self._pending.append(id)
+            if len(self._pending) == 1:
+                # loads scheduled in the same loop iteration join this batch
+                loop.call_soon(self._schedule)
+        return await future
+
+    def _schedule(self):
+        task = asyncio.ensure_future(self._dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self):
+        ids, self._pending = self._pending, []
+        futures = [self._futures[str(id)] for id in ids]
+        try:
+            db_objs = await run_in_threadpool(self.repository.find_many, self.db, ids)
+        except Exception as e:
+            for id, future in zip(ids, futures):
+                self._futures.pop(str(id), None)
+                future.set_exception(e)
+            return
+
+        found = {str(db_obj.id): db_obj for db_obj in db_objs}
+        for id, future in zip(ids, futures):
+            future.set_result(found.get(str(id)))
+
+
+class ModelRepository(Generic[ModelType]):
+    """
+    What `BaseRepository` and `AsyncBaseRepository` share whatever the session: model metadata, cached
+    statements, the identity cache and the update logic.
+    """
+
+    def __init__(self, model: Type[ModelType], cache: CacheBackend = None, optimistic_lock: bool = False):
+        self.model = model
+        self.cache = cache
+        self.optimistic_lock = optimistic_lock
+        if cache is not None:
+            on_model_write(model, self._evict)
+        self._columns: Optional[Dict[str, InstrumentedAttribute]] = None
+        self._find_statements: Dict[Tuple[str, ...], Select] = {}
+
+    @property
+    def columns(self) -> Dict[str, InstrumentedAttribute]:
+        """
+        Column attributes of the model by name, resolved once (lazily, mappers may not be configured at import).
+        """
+        if self._columns is None:
+            self._columns = {
+                attribute.key: getattr(self.model, attribute.key)
+                for attribute in inspect(self.model).column_attrs
+            }
+        return self._columns
+
+    def _find_statement(self, names: Tuple[str, ...]) -> Select:
+        # one statement per set of column names, values are bound at execution
+        statement = self._find_statements.get(names)
+        if statement is None:
+            statement = select(self.model).where(self._bound_condition(names)).limit(1)
+            self._find_statements[names] = statement
+        return statement
+
+    def _bound_condition(self, names: Tuple[str, ...]) -> Any:
+        for name in names:
+            if name not in self.columns:
+                raise ValueError(f"Column `{name}` not found in `{self.model}`")
+
+        return and_(*[self.columns[name] == bindparam(name) for name in names])
+
+    def _cache_key(self, id: Any) -> str:
+        # ids from tokens or paths are strings, `5` and `"5"` share the entry
+        return f"{self.model.__tablename__}:{id}"
+
+    def _evict(self, model: Type, action: WriteAction, obj: Any):
+        if obj is None:
+            # unknown set of rows, e.g. a bulk write
+            self.cache.clear()
+        elif action != WriteAction.CREATE:
+            self.cache.delete(self._cache_key(obj.id))
+
+    def _cache_values(self, db_obj: ModelType) -> Dict[str, Any]:
+        return {name: getattr(db_obj, name) for name in self.columns}
+
+    def _cached(self, identity_map: Any, id: Any) -> Optional[ModelType]:
+        """
+        Cached row of `id` as a detached copy, to merge into the session without any query. The instance the
+        session already holds is returned instead: it is at least as fresh, merging would overwrite it.
+        """
+        values = self.cache.get(self._cache_key(id))
+        if values is None:
+            return None
+
+        db_obj = self.model(**values)
+        make_transient_to_detached(db_obj)
+        return identity_map.get(inspect(db_obj).key, db_obj)
+
+    @staticmethod
+    def _merged(db_obj: ModelType) -> ModelType:
+        # values of the cache are the origin of dirty tracking, `update` reloads such objects first
+        inspect(db_obj).info[FROM_CACHE_KEY] = True
+        return db_obj
+
+    def _update_changes(self, db_obj: ModelType, obj_in: Union[BaseModel, Dict[str, Any]]) -> Dict[str, Any]:
+        db_obj.fill(obj_in)
+        return dirty_values(db_obj)
+
+    def _update_statement(self, db: Any, db_obj: ModelType, changes: Dict[str, Any]) -> Update:
+        return update_statement(db_obj, changes, db.get_bind().dialect, self.optimistic_lock)
+
+    def _apply_update(self, db: Any, db_obj: ModelType, changes: Dict[str, Any], result: Any):
+        """
+        Mark `changes` written by `result` as the committed state of `db_obj`, no flush nor reload needed.
+        An `updated_at` set by the database without RETURNING is left unloaded rather than read back: a sync
+        session loads it on access, with an async one `await db.refresh(db_obj, ["updated_at"])`.
+        """
+        if result.rowcount == 0:
+            raise ConflictException(message=f"`{self.model.__name__}` was changed or removed, reload it!")
+        if result.returns_rows:
+            changes["updated_at"] = result.scalar_one()
+        db_obj.remember_changes()
+        for key, value in changes.items():
+            set_committed_value(db_obj, key, value)
+        if "updated_at" in self.columns and "updated_at" not in changes:
+            db.expire(db_obj, ["updated_at"])
+
+
+class BaseRepository(ModelRepository[ModelType], Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    def __init__(self, model: Type[ModelType], cache: CacheBackend = None, optimistic_lock: bool = False):
         """
         CRUD object with default methods to Create, Read, Update, Delete (CRUD).
+        Writes commit on their own, inside a unit of work (see `get_db`) they only flush.
 
         **Parameters**
 
         * `model`: A SQLAlchemy model class
         * `schema`: A Pydantic model (schema) class
+        * `cache`: Opt-in identity cache of `find` by primary key, one backend per repository
+        * `optimistic_lock`: `update` fails with a conflict when `updated_at` changed since the object was loaded,
+          it must be loaded (without RETURNING, reload an object after updating it)
         """
-        self.model = model
+        super().__init__(model, cache=cache, optimistic_lock=optimistic_lock)
+        self._exists_statements: Dict[Tuple[str, ...], Select] = {}
+        self._unique_keys: Optional[List[Tuple[str, ...]]] = None
+
+    def find(self, db: Session, id: Any, use_cache: bool = True) -> Optional[ModelType]:
+        """
+        Row by primary key. With `use_cache=False` the identity cache is neither read nor filled,
+        for lookups which can't be stale, e.g. authentication.
+        """
+        if self.cache is None or not use_cache:
+            return db.query(self.model).filter(self.model.id == id).first()
+
+        db_obj = self._from_cache(db, id)
+        if db_obj is not None:
+            return db_obj
 
-    def find(self, db: Session, id: Any) -> Optional[ModelType]:
-        return db.query(self.model).filter(self.model.id == id).first()
+        db_obj = db.query(self.model).filter(self.model.id == id).first()
+        if db_obj is not None:
+            self._to_cache(db, db_obj)
+        return db_obj
+
+    def find_many(self, db: Session, ids: Sequence[Any], *filter_conditions) -> List[ModelType]:
+        """
+        Rows of `ids` in the same order, missing ids are skipped. One `WHERE id IN (...)` per chunk of ids.
+        Rows must also match `filter_conditions`, which only the database can tell: the cache is bypassed then.
+        """
+        ids = list(dict.fromkeys(ids))
+        found: Dict[str, ModelType] = {}
+        missing = ids
+        if self.cache is not None and not filter_conditions:
+            missing = []
+            for id in ids:
+                db_obj = self._from_cache(db, id)
+                if db_obj is None:
+                    missing.append(id)
+                else:
+                    found[str(id)] = db_obj
+
+        for chunk in chunked(missing, BULK_CHUNK_SIZE):
+            for db_obj in db.query(self.model).filter(self.model.id.in_(chunk), *filter_conditions).all():
+                found[str(db_obj.id)] = db_obj
+                if self.cache is not None:
+                    self._to_cache(db, db_obj)
+
+        return [found[str(id)] for id in ids if str(id) in found]
+
+    def loader(self, db: Session) -> BatchLoader[ModelType]:
+        """
+        The batch loader of this model for `db`, created on first use.
+        """
+        key = ("batch_loader", self.model)
+        if key not in db.info:
+            db.info[key] = BatchLoader(self, db)
+        return db.info[key]
 
     def find_by_columns(self, db: Session, **kwargs) -> Optional[ModelType]:
-        attributes = inspect.getmembers(self.model, lambda a: not (inspect.isroutine(a)))
-        attr = {a[0]: a[1] for a in attributes if not (a[0].startswith('__') and a[0].endswith('__'))}
-        filter_condition = and_(*[attr[column] == value for column, value in kwargs.items()])
-        return db.query(self.model).filter(filter_condition).first()
+        if self.cache is not None and list(kwargs) == ["id"]:
+            return self.find(db, kwargs["id"])
+        return db.execute(self._find_statement(tuple(sorted(kwargs))), kwargs).scalars().first()
+
+    def exists(self, db: Session, **kwargs) -> bool:
+        """
+        Whether a row matches every column value, with `SELECT 1 ... LIMIT 1`, nothing is loaded.
+        """
+        return db.execute(self._exists_statement(tuple(sorted(kwargs))), kwargs).first() is not None
+
+    def _exists_statement(self, names: Tuple[str, ...]) -> Select:
+        statement = self._exists_statements.get(names)
+        if statement is None:
+            statement = select(literal(1)).select_from(self.model).where(self._bound_condition(names)).limit(1)
+            self._exists_statements[names] = statement
+        return statement
 
     def get(
             self, db: Session, *filter_conditions
     ) -> List[ModelType]:
         return db.query(self.model).filter(*filter_conditions).all()
 
+    def iterate(
+            self, db: Session, *filter_conditions, chunk_size: int = BULK_CHUNK_SIZE
+    ) -> Iterator[List[ModelType]]:
+        """
+        Stream the rows matching `filter_conditions` from a server-side cursor, in chunks of objects detached
+        from the session, memory stays at one chunk. Unordered. The cursor holds the connection until exhausted,
+        don't commit nor write on `db` in between, use `iterate_keyset` for that.
+        """
+        statement = select(self.model).where(*filter_conditions).execution_options(yield_per=chunk_size)
+        for chunk in db.execute(statement).scalars().partitions(chunk_size):
+            for db_obj in chunk:
+                db.expunge(db_obj)
+            yield chunk
+
+    def iterate_keyset(
+            self, db: Session, *filter_conditions, chunk_size: int = BULK_CHUNK_SIZE
+    ) -> Iterator[List[ModelType]]:
+        """
+        Rows matching `filter_conditions` in chunks of detached objects ordered by `id`, one `id > last id`
+        query per chunk. Nothing stays open between chunks, the caller may write and commit in between.
+        """
+        statement = select(self.model).where(*filter_conditions).order_by(self.model.id).limit(chunk_size)
+        last_id = None
+        while True:
+            page = statement if last_id is None else statement.where(self.model.id > last_id)
+            chunk = db.execute(page).scalars().all()
+            if not chunk:
+                return
+
+            for db_obj in chunk:
+                db.expunge(db_obj)
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            last_id = chunk[-1].id
+
     def create(self, db: Session, obj_in: CreateSchemaType) -> ModelType:
         try:
             db_obj: Base = self.model()
             db_obj.fill(obj_in)
             db.add(db_obj)
-            db.commit()
-            return db_obj
+            self._index_ngrams(db, db_obj)
+            self._commit(db)
         except Exception as e:
             LOGGER.error(str(e))
             db.rollback()
             raise
 
+        dispatch_after_commit(db, self.model, WriteAction.CREATE, db_obj)
+        return db_obj
+
     def update(
             self,
             db: Session,
@@ -59,26 +370,324 @@ class BaseRepository(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             obj_in: Union[UpdateSchemaType, Dict[str, Any]]
     ) -> ModelType:
         try:
-            db_obj.fill(obj_in)
-            if db_obj.is_dirty():
-                db.add(db_obj)
-                db.commit()
+            if inspect(db_obj).info.pop(FROM_CACHE_KEY, False):
+                # values of the cache are the origin of dirty tracking: a stale one would hide changes
                 db.refresh(db_obj)
-            return db_obj
+            changes = self._update_changes(db_obj, obj_in)
+            if not changes:
+                return db_obj
+
+            result = db.execute(self._update_statement(db, db_obj, changes))
+            self._apply_update(db, db_obj, changes, result)
+            if ngram_columns(self.model):
+                index_records(db, self.model, [{**changes, "id": db_obj.id}])
+            self._commit(db)
         except Exception as e:
             LOGGER.error(str(e))
             db.rollback()
             raise
 
+        dispatch_after_commit(db, self.model, WriteAction.UPDATE, db_obj)
+        return db_obj
+
     def remove(self, db: Session, id: int, model: ModelType = None) -> ModelType:
         try:
             if model is None:
                 model = db.query(self.model).get(id)
 
+            unindex_record(db, self.model, model.id)
             db.delete(model)
-            db.commit()
-            return model
+            self._commit(db)
+        except Exception as e:
+            LOGGER.error(str(e))
+            db.rollback()
+            raise
+
+        dispatch_after_commit(db, self.model, WriteAction.REMOVE, model)
+        return model
+
+    def delete_by_id(self, db: Session, id: Any) -> int:
+        """
+        Delete a row with a single DELETE, without loading it. Returns the number of deleted rows (0 or 1).
+        """
+        try:
+            unindex_record(db, self.model, id)
+            # a loaded copy of the row is removed from the session, the id criteria is evaluated in python
+            deleted = db.query(self.model).filter(self.model.id == id).delete(synchronize_session="evaluate")
+            self._commit(db)
         except Exception as e:
             LOGGER.error(str(e))
             db.rollback()
             raise
+
+        if deleted:
+            # listeners only get a transient stand-in carrying the id
+            dispatch_after_commit(db, self.model, WriteAction.REMOVE, self.model(id=id))
+        return deleted
+
+    def delete_where(self, db: Session, *filter_conditions) -> int:
+        """
+        Delete every row matching `filter_conditions` with a single DELETE, returns the number of deleted rows.
+        Loaded copies of the rows are not synchronized, don't use them afterwards.
+        """
+        if not filter_conditions:
+            raise ValueError("`delete_where` requires at least one condition")
+
+        try:
+            unindex_where(db, self.model, *filter_conditions)
+            deleted = db.execute(delete(self.model.__table__).where(*filter_conditions)).rowcount
+            self._commit(db)
+        except Exception as e:
+            LOGGER.error(str(e))
+            db.rollback()
+            raise
+
+        if deleted:
+            dispatch_after_commit(db, self.model, WriteAction.REMOVE)
+        return deleted
+
+    def create_many(
+            self,
+            db: Session,
+            objs_in: Sequence[Union[CreateSchemaType, Dict[str, Any]]],
+            chunk_size: int = BULK_CHUNK_SIZE,
+            index_elements: Sequence[str] = None,
+    ) -> int:
+        """
+        Insert `objs_in` with one executemany INSERT (multi-row VALUES on MySQL) and one commit per chunk,
+        timestamps are bound like other values, see `_with_timestamps`.
+        No ORM object is built nor returned, returns the number of inserted rows.
+        A failing chunk is rolled back and raised, chunks committed before it stay. Inside a unit of work
+        chunks are only flushed and everything commits or rolls back together.
+        Models with n-gram columns look the new ids up by `index_elements`, a unique key given in every row
+        (default: the first such key of the table).
+        """
+        total = 0
+        for chunk in chunked(objs_in, chunk_size):
+            rows = [self._values(obj_in) for obj_in in chunk]
+            try:
+                rows = self._with_timestamps(db, rows)
+                key = self._unique_key(rows, index_elements) if ngram_columns(self.model) else None
+                self._execute_many(db, insert(self.model.__table__), rows)
+                if key is not None:
+                    self._index_ngrams_by(db, rows, key)
+                self._commit(db)
+            except Exception as e:
+                LOGGER.error(str(e))
+                db.rollback()
+                raise
+
+            total += len(rows)
+            dispatch_after_commit(db, self.model, WriteAction.CREATE)
+        return total
+
+    def update_many(
+            self,
+            db: Session,
+            objs_in: Sequence[Dict[str, Any]],
+            chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        """
+        Update rows by `id` with one executemany UPDATE and one commit per chunk, each item is a dict of `id`
+        and the columns to set. Loaded objects of the session are not refreshed. Returns the number of items.
+        """
+        table = self.model.__table__
+        statement = update(table).where(table.c.id == bindparam("_id"))
+        total = 0
+        for chunk in chunked(objs_in, chunk_size):
+            rows = [self._values(obj_in) for obj_in in chunk]
+            try:
+                self._execute_many(db, statement, [
+                    {"_id": row["id"], **{key: value for key, value in row.items() if key != "id"}} for row in rows
+                ])
+                if ngram_columns(self.model):
+                    index_records(db, self.model, rows)
+                self._commit(db)
+            except Exception as e:
+                LOGGER.error(str(e))
+                db.rollback()
+                raise
+
+            total += len(rows)
+            dispatch_after_commit(db, self.model, WriteAction.UPDATE)
+        return total
+
+    def upsert_many(
+            self,
+            db: Session,
+            objs_in: Sequence[Union[CreateSchemaType, Dict[str, Any]]],
+            chunk_size: int = BULK_CHUNK_SIZE,
+            update_columns: Sequence[str] = None,
+            index_elements: Sequence[str] = None,
+    ) -> int:
+        """
+        Insert `objs_in`, or update `update_columns` (default: every given column) of the rows they collide with.
+        MySQL uses `INSERT ... ON DUPLICATE KEY UPDATE`, which fires on any unique key, PostgreSQL and SQLite
+        use `ON CONFLICT (index_elements) DO UPDATE`. `index_elements` must be a unique key given in every row,
+        by default the first such key of the table (`id`, then unique columns). One commit per chunk,
+        returns the number of items.
+        """
+        dialect = db.get_bind().dialect.name
+        total = 0
+        for chunk in chunked(objs_in, chunk_size):
+            rows = [self._values(obj_in) for obj_in in chunk]
+            try:
+                rows = self._with_timestamps(db, rows)
+                key = self._unique_key(rows, index_elements)
+                for keys, group in self._group_by_keys(rows):
+                    statement = self._upsert_statement(dialect, keys, update_columns, key)
+                    db.execute(statement, group)
+                if ngram_columns(self.model):
+                    self._index_ngrams_by(db, rows, key)
+                self._commit(db)
+            except Exception as e:
+                LOGGER.error(str(e))
+                db.rollback()
+                raise
+
+            total += len(rows)
+            # some rows may be new, listeners treat it as an unknown set of created rows
+            dispatch_after_commit(db, self.model, WriteAction.CREATE)
+        return total
+
+    def _upsert_statement(
+            self,
+            dialect: str,
+            keys: Tuple[str, ...],
+            update_columns: Optional[Sequence[str]],
+            index_elements: Sequence[str],
+    ) -> Any:
+        if dialect == "mysql":
+            from sqlalchemy.dialects.mysql import insert as dialect_insert
+        elif dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            raise ValueError(f"Upsert is not supported on `{dialect}`")
+
+        statement = dialect_insert(self.model.__table__)
+        excluded = statement.inserted if dialect == "mysql" else statement.excluded
+        columns = update_columns or [key for key in keys if key not in index_elements and key != "created_at"]
+        values = {column: excluded[column] for column in columns}
+        if "updated_at" in self.model.__table__.c and "updated_at" not in values:
+            # `onupdate` is not applied to the update part of an upsert
+            values["updated_at"] = func.now()
+
+        if dialect == "mysql":
+            return statement.on_duplicate_key_update(values)
+        return statement.on_conflict_do_update(index_elements=list(index_elements), set_=values)
+
+    @property
+    def unique_keys(self) -> List[Tuple[str, ...]]:
+        """
+        Column names of the primary key and of every unique constraint or index of the table, in that order.
+        """
+        if self._unique_keys is None:
+            table = self.model.__table__
+            unique = [
+                tuple(column.key for column in constraint.columns)
+                for constraint in table.constraints if isinstance(constraint, UniqueConstraint)
+            ]
+            unique.extend(tuple(column.key for column in index.columns) for index in table.indexes if index.unique)
+            unique.extend((column.key,) for column in table.columns if column.unique)
+            # constraints and indexes are sets, order by column position so the default key is stable
+            positions = {column.key: position for position, column in enumerate(table.columns)}
+            unique.sort(key=lambda key: [positions[name] for name in key])
+            primary_key = tuple(column.key for column in table.primary_key.columns)
+            self._unique_keys = list(dict.fromkeys([primary_key, *unique]))
+        return self._unique_keys
+
+    def _unique_key(self, rows: List[Dict[str, Any]], index_elements: Optional[Sequence[str]]) -> Tuple[str, ...]:
+        # rows are matched to the table by this key, a missing value would silently match nothing
+        def given(key: Tuple[str, ...]) -> bool:
+            return all(row.get(name) is not None for row in rows for name in key)
+
+        if index_elements is not None:
+            key = tuple(index_elements)
+            if key not in self.unique_keys:
+                raise ValueError(f"`{', '.join(key)}` is not a unique key of `{self.model.__tablename__}`")
+            if not given(key):
+                raise ValueError(f"Every row must give `{', '.join(key)}`")
+            return key
+
+        for key in self.unique_keys:
+            if given(key):
+                return key
+        raise ValueError(f"Rows don't share any unique key of `{self.model.__tablename__}`")
+
+    def _index_ngrams_by(self, db: Session, rows: List[Dict[str, Any]], index_elements: Sequence[str]):
+        # inserted or upserted rows don't carry their id, look them up by the unique key
+        columns = [getattr(self.model, name) for name in index_elements]
+        keys = [tuple(row.get(name) for name in index_elements) for row in rows]
+        if len(columns) == 1:
+            condition = columns[0].in_([key[0] for key in keys])
+        else:
+            condition = tuple_(*columns).in_(keys)
+
+        attributes = [getattr(self.model, name) for name in ngram_columns(self.model)]
+        records = db.query(self.model.id, *attributes).filter(condition).all()
+        index_records(db, self.model, [record._asdict() for record in records])
+
+    def _from_cache(self, db: Session, id: Any) -> Optional[ModelType]:
+        db_obj = self._cached(db.identity_map, id)
+        if db_obj is None or not inspect(db_obj).detached:
+            return db_obj
+        return self._merged(db.merge(db_obj, load=False))
+
+    def _to_cache(self, db: Session, db_obj: ModelType):
+        # values read inside a unit of work may still be rolled back, they are cached once committed
+        run_after_commit(db, self.cache.set, self._cache_key(db_obj.id), self._cache_values(db_obj))
+
+    def _values(self, obj_in: Union[BaseModel, Dict[str, Any]]) -> Dict[str, Any]:
+        if isinstance(obj_in, BaseModel):
+            obj_in = obj_in.dict(exclude_unset=True)
+        return {key: value for key, value in obj_in.items() if key in self.columns}
+
+    @staticmethod
+    def _group_by_keys(rows: List[Dict[str, Any]]) -> List[Tuple[Tuple[str, ...], List[Dict[str, Any]]]]:
+        # executemany binds the same columns for every row, rows setting different columns run separately
+        groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        return list(groups.items())
+
+    def _with_timestamps(self, db: Session, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Rows with `created_at` and `updated_at` bound to the database clock, read once per chunk. Their
+        `now()` defaults would be inlined in VALUES, which pymysql can't rewrite into a multi-row INSERT:
+        it would run one INSERT per row.
+        """
+        names = [name for name in TIMESTAMP_COLUMNS if name in self.columns and any(name not in row for row in rows)]
+        if not names:
+            return rows
+
+        now = db.execute(select(func.now())).scalar()
+        return [{**{name: now for name in names}, **row} for row in rows]
+
+    def _execute_many(self, db: Session, statement: Any, rows: List[Dict[str, Any]]):
+        for _, group in self._group_by_keys(rows):
+            db.execute(statement, group)
+
+    @staticmethod
+    def _commit(db: Session):
+        if in_unit_of_work(db):
+            # the owner of the session commits, see `get_db`
+            db.flush()
+            return
+
+        # objects of the session stay loaded, their state was just written
+        expire_on_commit = db.expire_on_commit
+        db.expire_on_commit = False
+        try:
+            db.commit()
+        finally:
+            db.expire_on_commit = expire_on_commit
+
+    def _index_ngrams(self, db: Session, db_obj: ModelType):
+        if not ngram_columns(self.model):
+            return
+
+        # new records need their id before the n-grams can reference it
+        db.flush()
+        index_record(db, db_obj)
@@ -32,6 +32,15 @@ class BadPayloadException(VHTTPException):
         )
 
 
+class ConflictException(VHTTPException):
+    def __init__(self, message: str, errors: Any = None):
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            message=message,
+            errors=errors
+        )
+
+
 def success_response(response: Response, message: str, data: Any, errors: Any = None,
                      status_code: int = status.HTTP_200_OK) -> Dict:
     response.status_code = status_code
@@ -0,0 +1,145 @@
+import re
+from enum import Enum
+from typing import Any, List, NamedTuple, Sequence
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import ColumnElement, literal
+
+LIKE_ESCAPE_CHAR = "\\"
+# InnoDB `innodb_ft_min_token_size` default, shorter words are not indexed
+FULLTEXT_MIN_TOKEN_SIZE = 3
+
+_fulltext_operators = re.compile(r'[+\-<>()~*"@]+')
+
+
+class SearchMode(str, Enum):
+    # `col LIKE '%kw%'`, always works but can't use any index
+    SUBSTRING = "substring"
+    # `col LIKE 'kw%'`, served by a B-tree index on the column
+    PREFIX = "prefix"
+    # `MATCH (cols) AGAINST ('kw*' IN BOOLEAN MODE)`, served by a MySQL FULLTEXT index over all fulltext columns
+    FULLTEXT = "fulltext"
+    # `id IN (rows having every n-gram of kw) AND col LIKE '%kw%'`, served by the `search_ngrams` side index
+    NGRAM = "ngram"
+
+
+class WordMatch(str, Enum):
+    # every word must match at least one column, "john smith" only finds John Smith
+    ALL = "all"
+    # any word matching any column is enough, "john smith" finds every John and every Smith
+    ANY = "any"
+
+
+class SearchIndex(NamedTuple):
+    name: str
+    table_name: str
+    columns: List[str]
+    fulltext: bool = False
+
+
+class MatchAgainst(ColumnElement):
+    # relevance score, not typed as boolean so it's never rendered as `MATCH (...) = 1`
+    # contains its own bind parameter, let SQLAlchemy skip statement caching instead of warning about it
+    inherit_cache = False
+
+    def __init__(self, columns: Sequence[Any], against: str):
+        self.columns = list(columns)
+        self.against = literal(against)
+
+
+@compiles(MatchAgainst)
+def _compile_match_against(element: MatchAgainst, compiler, **kw) -> str:
+    return "MATCH (%s) AGAINST (%s IN BOOLEAN MODE)" % (
+        ", ".join(compiler.process(column, **kw) for column in element.columns),
+        compiler.process(element.against, **kw),
+    )
+
+
+def escape_like(keyword: str) -> str:
+    return (
+        keyword
+        .replace(LIKE_ESCAPE_CHAR, LIKE_ESCAPE_CHAR * 2)
+        .replace("%", LIKE_ESCAPE_CHAR + "%")
+        .replace("_", LIKE_ESCAPE_CHAR + "_")
+    )
+
+
+def substring_condition(column: Any, keyword: str) -> Any:
+    return column.ilike(f"%{escape_like(keyword)}%", escape=LIKE_ESCAPE_CHAR)
+
+
+def prefix_condition(column: Any, keyword: str, dialect: str) -> Any:
+    pattern = f"{escape_like(keyword)}%"
+    if dialect in ("mysql", "sqlite"):
+        # case insensitive already, `ilike` would wrap the column in `lower()` and lose the index
+        return column.like(pattern, escape=LIKE_ESCAPE_CHAR)
+    return column.ilike(pattern, escape=LIKE_ESCAPE_CHAR)
+
+
+def fulltext_terms(keywords: List[str], required: bool = False) -> str:
+    """
+    Build a boolean mode search string, each word is matched as a prefix.
+    """
+    terms = []
+    for keyword in keywords:
+        for word in _fulltext_operators.sub(" ", keyword).split():
+            terms.append(f"{'+' if required else ''}{word}*")
+    return " ".join(terms)
+
+
+def fulltext_condition(columns: Sequence[Any], keywords: List[str], required: bool = False) -> Any:
+    return MatchAgainst(columns, fulltext_terms(keywords, required=required))
+
+
+def search_indexes(datatable_cls: Any) -> List[SearchIndex]:
+    """
+    Indexes serving the searchable columns of a datatable: one FULLTEXT index over every fulltext column,
+    and a B-tree index for each prefix column which isn't indexed yet.
+    """
+    indexes = []
+    fulltext_columns = []
+    for definition in datatable_cls.get_columns():
+        if not definition.searchable or not hasattr(definition.data, "property"):
+            continue
+
+        column = definition.data.property.columns[0]
+        if definition.search == SearchMode.FULLTEXT:
+            fulltext_columns.append(column)
+        elif definition.search == SearchMode.PREFIX and not (column.primary_key or column.unique or column.index):
+            indexes.append(SearchIndex(f"ix_{column.table.name}_{column.name}", column.table.name, [column.name]))
+
+    if fulltext_columns:
+        table_name = fulltext_columns[0].table.name
+        indexes.append(SearchIndex(
+            f"ft_{table_name}_search",
+            table_name,
+            [column.name for column in fulltext_columns],
+            fulltext=True,
+        ))
+
+    return indexes
+
+
+def create_search_indexes(datatable_cls: Any):
+    """
+    Alembic helper, call inside a migration `upgrade()`:
+
+        create_search_indexes(UserDataTable)
+    """
+    from alembic import op
+
+    for index in search_indexes(datatable_cls):
+        if index.fulltext:
+            op.create_index(index.name, index.table_name, index.columns, mysql_prefix="FULLTEXT")
+        else:
+            op.create_index(index.name, index.table_name, index.columns)
+
+
+def drop_search_indexes(datatable_cls: Any):
+    """
+    Alembic helper, call inside a migration `downgrade()`.
+    """
+    from alembic import op
+
+    for index in search_indexes(datatable_cls):
+        op.drop_index(index.name, table_name=index.table_name)
@@ -0,0 +1,90 @@
+from typing import Any, Callable, Coroutine, Type
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.events import WriteAction, dispatch_model_write
+from app.core.logger import LOGGER
+
+UNIT_OF_WORK_KEY = "unit_of_work"
+# `request.state` flag set by `UnitOfWorkRoute`, only those routes commit before the response is sent
+UNIT_OF_WORK_STATE = "unit_of_work"
+# (callback, args) registered inside the unit of work, called once it's committed
+PENDING_CALLBACKS_KEY = "after_commit_callbacks"
+
+
+def begin_unit_of_work(db: Session):
+    """
+    Repositories only flush on `db`, whoever owns the session commits once at the end.
+    """
+    db.info[UNIT_OF_WORK_KEY] = True
+
+
+def in_unit_of_work(db: Session) -> bool:
+    return db.info.get(UNIT_OF_WORK_KEY, False)
+
+
+def wants_unit_of_work(request: Request) -> bool:
+    return getattr(request.state, UNIT_OF_WORK_STATE, False)
+
+
+def run_after_commit(db: Session, callback: Callable[..., Any], *args: Any):
+    """
+    Call `callback(*args)` now, or when the unit of work of `db` commits. A rollback drops it.
+    """
+    if not in_unit_of_work(db):
+        callback(*args)
+        return
+
+    db.info.setdefault(PENDING_CALLBACKS_KEY, []).append((callback, args))
+
+
+def dispatch_after_commit(db: Session, model: Type, action: WriteAction, obj: Any = None):
+    """
+    Dispatch a model write once it's committed, caches and counters never see writes which didn't happen.
+    """
+    run_after_commit(db, dispatch_model_write, model, action, obj)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_pending_callbacks(session: Session):
+    for callback, args in session.info.pop(PENDING_CALLBACKS_KEY, []):
+        try:
+            callback(*args)
+        except Exception as e:
+            # the transaction is committed already, a failing callback must not fail the request
+            LOGGER.error(str(e))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_callbacks(session: Session):
+    session.info.pop(PENDING_CALLBACKS_KEY, None)
+
+
+class UnitOfWorkRoute(APIRoute):
+    """
+    Commit the unit of work of the request (`request.state.db`, set by `get_db`) before the response is sent,
+    a failing commit still turns into an error response. Error responses roll it back.
+
+        router = APIRouter(route_class=UnitOfWorkRoute)
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def unit_of_work_handler(request: Request) -> Response:
+            # dependencies are solved inside `handler`, `get_db` sees the flag
+            setattr(request.state, UNIT_OF_WORK_STATE, True)
+            response = await handler(request)
+            db = getattr(request.state, "db", None)
+            if db is not None and in_unit_of_work(db):
+                if response.status_code >= 400:
+                    await run_in_threadpool(db.rollback)
+                else:
+                    await run_in_threadpool(db.commit)
+            return response
+
+        return unit_of_work_handler
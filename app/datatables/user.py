@@ -3,6 +3,7 @@ from typing import List
 from sqlalchemy.orm import Query as SQLQuery
 
 from app.core.datatable import BaseDataTable, DataTableColumn
+from app.core.search import SearchMode
 from app.models.user import User
 
 
@@ -11,12 +12,19 @@ class UserDataTable(BaseDataTable):
         (
             self
             .filter_column('full_name', lambda keyword: User.full_name.ilike(f"%{keyword}1%"))
-            .add_column('full_name_extra', lambda record: record.full_name + "extra")
+            .add_column('full_name_extra', lambda record: record.full_name + "extra", requires=[User.full_name])
             .add_index_column('stt')
         )
 
+    @staticmethod
+    def base_filter():
+        """
+        Users listed by this datatable, lookups by id outside of it must apply it too.
+        """
+        return User.is_admin != True
+
     def query(self) -> SQLQuery:
-        return self.session.query(User).filter(User.is_admin != True)
+        return self.session.query(User).filter(self.base_filter())
 
     @staticmethod
     def get_columns() -> List[DataTableColumn]:
@@ -24,17 +32,27 @@ class UserDataTable(BaseDataTable):
             DataTableColumn(
                 data=User.id,
                 orderable=True,
+                exportable=True,
             ),
             DataTableColumn(
                 data=User.full_name,
                 searchable=True,
+                exportable=True,
             ),
             DataTableColumn(
                 data=User.phone,
                 searchable=True,
+                search=SearchMode.NGRAM,
+                exportable=True,
             ),
             DataTableColumn(
                 data=User.email,
                 searchable=True,
-            )
+                orderable=True,
+                exportable=True,
+            ),
+            DataTableColumn(
+                data='full_name_extra',
+                exportable=True,
+            ),
         ]
@@ -0,0 +1,35 @@
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db.routing import RoutingSession
+from app.db.session import replicas
+
+async_engine = create_async_engine(
+    settings.ASYNC_SQLALCHEMY_DATABASE_URI,
+    pool_pre_ping=True,
+    echo=settings.SQLALCHEMY_DEBUG,
+    pool_size=10,
+    max_overflow=20,
+)
+# the routing session works on the sync engines wrapped by the async ones
+async_replicas = replicas.sibling([
+    create_async_engine(
+        uri,
+        pool_pre_ping=True,
+        echo=settings.SQLALCHEMY_DEBUG,
+        pool_size=10,
+        max_overflow=20,
+    ).sync_engine
+    for uri in settings.ASYNC_SQLALCHEMY_REPLICA_URIS
+])
+# objects stay loaded after commit, an expired attribute can't be lazy loaded outside of an await
+AsyncSessionLocal = sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+    replicas=async_replicas,
+)
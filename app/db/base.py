@@ -2,3 +2,4 @@
 # imported by Alembic
 from app.core.model import Base  # noqa
 from app.models.user import User  # noqa
+from app.models.search_ngram import SearchNgram  # noqa
@@ -0,0 +1,158 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Generator, Iterable, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.util import find_tables
+
+# dialects accepting `SET TRANSACTION READ ONLY` for the transaction about to start
+READ_ONLY_DIALECTS = ("mysql", "postgresql")
+
+
+def _read_only_transaction(connection: Any):
+    if connection.dialect.name not in READ_ONLY_DIALECTS:
+        return
+
+    # DBAPI level, executing on `connection` itself would begin the transaction again
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute("SET TRANSACTION READ ONLY")
+    finally:
+        cursor.close()
+
+
+class ReplicaSet:
+    """
+    Read replicas picked round-robin. A replica failing to connect is skipped for `retry_after` seconds,
+    tables written by this process are read from the primary for `read_after_write` seconds (replication lag).
+    """
+
+    def __init__(self, engines: List[Engine], retry_after: float = 30, read_after_write: float = 5):
+        self.engines = engines
+        self.retry_after = retry_after
+        self.read_after_write = read_after_write
+        self._unhealthy_until: Dict[Engine, float] = {}
+        self._written_until: Dict[str, float] = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+        for engine in engines:
+            event.listen(engine, "begin", _read_only_transaction)
+            event.listen(engine, "handle_error", self._on_error)
+
+    def sibling(self, engines: List[Engine]) -> "ReplicaSet":
+        """
+        Replica set of other engines to the same servers (e.g. async drivers), writes recorded by either one
+        send reads of both to the primary.
+        """
+        replicas = ReplicaSet(engines, retry_after=self.retry_after, read_after_write=self.read_after_write)
+        replicas._written_until = self._written_until
+        replicas._lock = self._lock
+        return replicas
+
+    def choose(self) -> Optional[Engine]:
+        healthy = [engine for engine in self.engines if self.is_healthy(engine)]
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    def is_healthy(self, engine: Engine) -> bool:
+        return self._unhealthy_until.get(engine, 0) <= time.monotonic()
+
+    def mark_unhealthy(self, engine: Engine):
+        with self._lock:
+            self._unhealthy_until[engine] = time.monotonic() + self.retry_after
+
+    def mark_written(self, tables: Iterable[str]):
+        until = time.monotonic() + self.read_after_write
+        with self._lock:
+            for table in tables:
+                self._written_until[table] = until
+
+    def recently_written(self, tables: Iterable[str]) -> bool:
+        now = time.monotonic()
+        return any(self._written_until.get(table, 0) > now for table in tables)
+
+    def _on_error(self, context: Any):
+        # lost connections and failures to connect take the replica out of the rotation
+        if context.is_disconnect or context.connection is None:
+            self.mark_unhealthy(context.engine)
+
+
+class RoutingSession(Session):
+    """
+    Session sending reads to a replica and writes to the primary (`bind`).
+
+    A session reads from a single replica, and stays on the primary once it has written anything,
+    so a request always reads its own writes. Use `using_primary()` for reads which must not lag.
+    A replica failing to connect is taken out of the rotation, and the read goes to the primary.
+    """
+
+    def __init__(self, replicas: ReplicaSet = None, **kwargs):
+        super().__init__(**kwargs)
+        self.replicas = replicas
+        self.written_tables: Set[str] = set()
+        self._replica: Optional[Engine] = None
+        self._force_primary = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        if self.replicas is None or not self.replicas.engines:
+            return primary
+
+        if clause is not None and getattr(clause, "is_dml", False):
+            self.written_tables.update(table.name for table in find_tables(clause, include_crud=True))
+            return primary
+        if self._flushing or self._force_primary or self.written_tables:
+            return primary
+        if self.replicas.recently_written(self._read_tables(mapper, clause)):
+            return primary
+
+        if self._replica is None or not self.replicas.is_healthy(self._replica):
+            self._replica = self.replicas.choose()
+        return self._replica or primary
+
+    def _connection_for_bind(self, engine, execution_options=None, **kw):
+        if self.replicas is None or engine not in self.replicas.engines:
+            return super()._connection_for_bind(engine, execution_options, **kw)
+
+        try:
+            return super()._connection_for_bind(engine, execution_options, **kw)
+        except DBAPIError:
+            self.replicas.mark_unhealthy(engine)
+            self._replica = None
+            return super()._connection_for_bind(self.bind, execution_options, **kw)
+
+    @contextmanager
+    def using_primary(self) -> Generator:
+        force_primary = self._force_primary
+        self._force_primary = True
+        try:
+            yield self
+        finally:
+            self._force_primary = force_primary
+
+    @staticmethod
+    def _read_tables(mapper: Any, clause: Any) -> Set[str]:
+        if clause is not None:
+            return {table.name for table in find_tables(clause, include_joins=True)}
+        if mapper is not None:
+            return {table.name for table in mapper.tables}
+        return set()
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _record_flushed_tables(session: RoutingSession, flush_context: Any):
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        session.written_tables.add(obj.__table__.name)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _record_committed_tables(session: RoutingSession):
+    if session.replicas is not None and session.written_tables:
+        session.replicas.mark_written(session.written_tables)
@@ -2,6 +2,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.db.routing import ReplicaSet, RoutingSession
 
 engine = create_engine(
     settings.SQLALCHEMY_DATABASE_URI,
@@ -10,4 +11,18 @@ engine = create_engine(
     pool_size=10,
     max_overflow=20,
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+replicas = ReplicaSet(
+    [
+        create_engine(
+            uri,
+            pool_pre_ping=True,
+            echo=settings.SQLALCHEMY_DEBUG,
+            pool_size=10,
+            max_overflow=20,
+        )
+        for uri in settings.SQLALCHEMY_REPLICA_URIS
+    ],
+    retry_after=settings.REPLICA_RETRY_SECONDS,
+    read_after_write=settings.REPLICA_READ_AFTER_WRITE_SECONDS,
+)
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine, replicas=replicas)
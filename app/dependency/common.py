@@ -1,16 +1,19 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core import security
 from app.core.config import settings
+from app.core.unit_of_work import begin_unit_of_work, wants_unit_of_work
+from app.db.async_session import AsyncSessionLocal
 from app.db.session import SessionLocal
 from app.models.user import User
-from app.repositories.user import user_repo
+from app.repositories.user import async_user_repo, user_repo
 from app.schemas.token import TokenPayload
 
 # define token URL for docs
@@ -19,31 +22,85 @@ reusable_oauth2 = OAuth2PasswordBearer(
 )
 
 
-def get_db() -> Generator:
+def get_db(request: Request) -> Generator:
+    """
+    On a `UnitOfWorkRoute`, one transaction per request: repositories only flush, the route commits once
+    before the response when the handler succeeds and rolls back otherwise. Other routes keep committing
+    each write, the code after `yield` runs once the response is sent and can't report a failed commit.
+    """
     try:
         db = SessionLocal()
+        if wants_unit_of_work(request):
+            begin_unit_of_work(db)
+            request.state.db = db
         yield db
+    except Exception:
+        db.rollback()
+        raise
     finally:
         # noinspection PyUnboundLocalVariable
         db.close()
 
 
-def get_current_user(
-        db: Session = Depends(get_db),
-        token: str = Depends(reusable_oauth2)
-) -> User:
+def get_db_autocommit() -> Generator:
+    """
+    Opt-out of the unit of work, for endpoints which need their writes committed one by one.
+    """
+    try:
+        db = SessionLocal()
+        yield db
+    finally:
+        # noinspection PyUnboundLocalVariable
+        db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def decode_token(token: str) -> TokenPayload:
+    """
+    Payload of an access token, its `sub` is a user id. Other tokens signed with the same key (e.g. password
+    reset ones, with an email) are rejected like invalid ones.
+    """
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
         token_data = TokenPayload(**payload)
-    except (jwt.JWTError, ValidationError):
+        token_data.sub = int(token_data.sub)
+        return token_data
+    except (jwt.JWTError, ValidationError, TypeError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
 
-    user = user_repo.find_by_columns(db, id=token_data.sub)
+
+def get_current_user(
+        db: Session = Depends(get_db),
+        token: str = Depends(reusable_oauth2)
+) -> User:
+    token_data = decode_token(token)
+    # the identity cache is per process, a user changed by another worker must not stay authenticated
+    user = user_repo.find(db, id=token_data.sub, use_cache=False)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    return user
+
+
+async def get_current_user_async(
+        db: AsyncSession = Depends(get_async_db),
+        token: str = Depends(reusable_oauth2)
+) -> User:
+    """
+    `get_current_user` on the event loop, for routers guarding async endpoints: no threadpool hop,
+    nor a sync session, just to authenticate.
+    """
+    token_data = decode_token(token)
+    user = await async_user_repo.find(db, token_data.sub, use_cache=False)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, String, BigInteger, Index
+
+from app.core.model import Base
+
+
+class SearchNgram(Base):
+    """
+    N-grams of the columns declared with `info={"ngram": True}`, maintained by `BaseRepository` writes.
+    """
+    id = Column(BigInteger, primary_key=True)
+
+    table_name = Column(String(64), nullable=False)
+    column_name = Column(String(64), nullable=False)
+    record_id = Column(BigInteger, nullable=False)
+    gram = Column(String(16), nullable=False)
+    # a side index, the `now()` defaults would also keep pymysql from batching its inserts into one statement
+    created_at = None
+    updated_at = None
+
+    __table_args__ = (
+        # candidate lookup: rows of a column having all grams of a keyword
+        Index("ix_search_ngrams_lookup", "table_name", "column_name", "gram", "record_id"),
+        # reindex/cleanup of a single record
+        Index("ix_search_ngrams_record", "table_name", "record_id"),
+    )
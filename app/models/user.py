@@ -12,7 +12,8 @@ class User(Base, AuthenticatableModel):
 
     full_name = Column(String(255), nullable=False)
     email = Column(String(255), unique=True, nullable=True)
-    phone = Column(String(255), unique=True, nullable=True)
+    # searched by infix in `UserDataTable`, see `app.core.ngram`
+    phone = Column(String(255), unique=True, nullable=True, info={"ngram": True})
     is_admin = Column(Boolean(), nullable=False, default=False)
 
     # relationships
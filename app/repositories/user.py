@@ -1,12 +1,21 @@
-from typing import Any, Dict, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Sequence, Union
 
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from app.core.repository import BaseRepository
+from app.core.async_repository import AsyncBaseRepository
+from app.core.cache import TTLCache
+from app.core.repository import BULK_CHUNK_SIZE, BaseRepository
 from app.core.security import get_password_hash
 from app.models.user import User
 from app.schemas.user import UserCreateRequest, UserUpdateRequest
 
+# bcrypt releases the GIL, hashes of a bulk write are computed in parallel threads
+HASH_WORKERS = 4
+
 
 class UserRepository(BaseRepository[User, UserCreateRequest, UserUpdateRequest], ):
     def create(self, db: Session, *, obj_in: UserCreateRequest) -> User:
@@ -18,13 +27,72 @@ class UserRepository(BaseRepository[User, UserCreateRequest, UserUpdateRequest],
     def update(
             self, db: Session, *, db_obj: User, obj_in: Union[UserUpdateRequest, Dict[str, Any]]
     ) -> User:
-        if obj_in.password:
+        if isinstance(obj_in, dict):
+            obj_in = dict(obj_in)
+            if obj_in.get("password"):
+                obj_in["password"] = get_password_hash(obj_in["password"])
+        elif obj_in.password:
             obj_in.password = get_password_hash(obj_in.password)
 
         return super().update(db, db_obj=db_obj, obj_in=obj_in)
 
+    def create_many(
+            self,
+            db: Session,
+            objs_in: Sequence[Union[UserCreateRequest, Dict[str, Any]]],
+            chunk_size: int = BULK_CHUNK_SIZE,
+            index_elements: Sequence[str] = None,
+    ) -> int:
+        return super().create_many(
+            db, self._hash_passwords(objs_in), chunk_size=chunk_size, index_elements=index_elements
+        )
+
+    def update_many(
+            self,
+            db: Session,
+            objs_in: Sequence[Dict[str, Any]],
+            chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+        return super().update_many(db, self._hash_passwords(objs_in), chunk_size=chunk_size)
+
+    def upsert_many(self, db: Session, objs_in: Sequence[Union[UserCreateRequest, Dict[str, Any]]], **kwargs) -> int:
+        return super().upsert_many(db, self._hash_passwords(objs_in), **kwargs)
+
+    @staticmethod
+    def _hash_passwords(objs_in: Sequence[Union[BaseModel, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        rows = [obj_in.dict(exclude_unset=True) if isinstance(obj_in, BaseModel) else dict(obj_in) for obj_in in objs_in]
+        hashed = [row for row in rows if row.get("password")]
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+            passwords = executor.map(get_password_hash, [row["password"] for row in hashed])
+            for row, password in zip(hashed, passwords):
+                row["password"] = password
+        return rows
+
     def is_admin(self, user: User) -> bool:
         return user.is_admin
 
 
-user_repo: UserRepository = UserRepository(User)
+class AsyncUserRepository(AsyncBaseRepository[User, UserCreateRequest, UserUpdateRequest]):
+    async def create(self, db: AsyncSession, *, obj_in: UserCreateRequest) -> User:
+        if obj_in.password:
+            # bcrypt is slow on purpose, keep it off the event loop
+            obj_in.password = await run_in_threadpool(get_password_hash, obj_in.password)
+
+        return await super().create(db, obj_in=obj_in)
+
+    async def update(
+            self, db: AsyncSession, *, db_obj: User, obj_in: Union[UserUpdateRequest, Dict[str, Any]]
+    ) -> User:
+        if isinstance(obj_in, dict):
+            obj_in = dict(obj_in)
+            if obj_in.get("password"):
+                obj_in["password"] = await run_in_threadpool(get_password_hash, obj_in["password"])
+        elif obj_in.password:
+            obj_in.password = await run_in_threadpool(get_password_hash, obj_in.password)
+
+        return await super().update(db, db_obj=db_obj, obj_in=obj_in)
+
+
+# the cache is per process and only cleared by writes of this process, authentication bypasses it
+user_repo: UserRepository = UserRepository(User, cache=TTLCache(maxsize=4096, ttl=60))
+async_user_repo: AsyncUserRepository = AsyncUserRepository(User, cache=user_repo.cache)
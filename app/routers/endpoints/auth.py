@@ -1,5 +1,7 @@
 from app.core.auth import make_auth_router
+from app.core.unit_of_work import UnitOfWorkRoute
 
 router = make_auth_router(
     reset_password=False,
+    route_class=UnitOfWorkRoute,
 )
@@ -1,34 +1,70 @@
-from typing import Any
+from typing import Any, Optional, Union
 
-from fastapi import Depends, APIRouter, Response
+from fastapi import Depends, APIRouter, Response, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from app.core.datatable import UseDatatable
+from app.core.datatable import UseDatatable, CachedCount, Projection, DataTableCache
 from app.core.logger import LOGGER
-from app.core.response import success_response, error_response, SuccessResponseSchema
+from app.core.response import success_response, error_response, SuccessResponseSchema, BadPayloadException
+from app.core.unit_of_work import UnitOfWorkRoute
 from app.datatables.user import UserDataTable
 from app.dependency import common
-from app.repositories.user import user_repo
-from app.schemas.user import UserUpdateRequest, UserCreateRequest, UserResponse, UserDatatableResponse
+from app.repositories.user import async_user_repo, user_repo
+from app.schemas.user import UserUpdateRequest, UserCreateRequest, UserResponse, UserDatatableResponse, \
+    UsersResponse
 
-router = APIRouter()
+# each request authenticates on the session its route uses, it holds a single connection. Routes of the sync
+# session are plain `def` (threadpool) unless all their blocking work is offloaded
+sync_router = APIRouter(route_class=UnitOfWorkRoute, dependencies=[Depends(common.get_current_user)])
+async_router = APIRouter(dependencies=[Depends(common.get_current_user_async)])
+
+# max ids of a `GET /users?ids=` multi-get
+MAX_IDS = 100
+
+use_user_datatable = UseDatatable(
+    UserDataTable,
+    logger=LOGGER,
+    # the base query filters out admins, a tracked counter can't follow it
+    count_provider=CachedCount(ttl=60),
+    projection=Projection.SCALAR,
+    result_cache=DataTableCache(ttl=30),
+)
 
 
-@router.get("/", response_model=UserDatatableResponse)
+@sync_router.get("/", response_model=Union[UserDatatableResponse, UsersResponse])
 async def get_users(
         *,
         db: Session = Depends(common.get_db),
         response: Response,
-        user_datatable: UserDataTable = Depends(UseDatatable(UserDataTable, logger=LOGGER))
+        user_datatable: UserDataTable = Depends(use_user_datatable),
+        ids: Optional[str] = Query(description=f"Comma separated ids (at most {MAX_IDS}), skips the datatable",
+                                   default=None),
 ) -> Any:
     """
-    Retrieve users.
+    Retrieve users, or the users of `ids` in one call.
     """
-    return await user_datatable.render(db, response)
+    if ids is None:
+        return await user_datatable.render(db, response)
+
+    try:
+        user_ids = [int(user_id) for user_id in ids.split(",") if user_id.strip()]
+    except ValueError:
+        raise BadPayloadException(message="Invalid `ids` params! Ids must be integers!")
+    if len(user_ids) > MAX_IDS:
+        raise BadPayloadException(message=f"Invalid `ids` params! At most {MAX_IDS} ids are allowed!")
+
+    users = await run_in_threadpool(user_repo.find_many, db, user_ids, UserDataTable.base_filter())
+    return success_response(
+        response=response,
+        message="",
+        data=users,
+    )
 
 
-@router.post("/", response_model=UserResponse)
-async def create_user(
+@sync_router.post("/", response_model=UserResponse)
+def create_user(
         *,
         db: Session = Depends(common.get_db),
         response: Response,
@@ -37,6 +73,13 @@ async def create_user(
     """
     Create new user.
     """
+    # checked before paying for the password hash, other duplicates still reach the IntegrityError handler
+    if user_repo.exists(db, username=user_in.username):
+        return error_response(
+            response=response,
+            message="Username existed!",
+        )
+
     user = user_repo.create(db, obj_in=user_in)
     return success_response(
         message="Create new user successfully!",
@@ -45,17 +88,17 @@ async def create_user(
     )
 
 
-@router.get("/{id}", response_model=UserResponse)
+@async_router.get("/{id}", response_model=UserResponse)
 async def read_user_by_id(
         *,
-        db: Session = Depends(common.get_db),
+        db: AsyncSession = Depends(common.get_async_db),
         response: Response,
         id: int,
 ) -> Any:
     """
     Get a specific user by id.
     """
-    user = user_repo.find(db, id=id)
+    user = await async_user_repo.find(db, id=id)
     if not user:
         return error_response(
             response=response,
@@ -68,8 +111,8 @@ async def read_user_by_id(
     )
 
 
-@router.put("/{id}", response_model=UserResponse)
-async def update_user(
+@sync_router.put("/{id}", response_model=UserResponse)
+def update_user(
         *,
         db: Session = Depends(common.get_db),
         response: Response,
@@ -79,7 +122,8 @@ async def update_user(
     """
     Update a user.
     """
-    user = user_repo.find(db, id=id)
+    # the cache may lag behind other workers, never the base of a write
+    user = user_repo.find(db, id=id, use_cache=False)
     if not user:
         return error_response(
             response=response,
@@ -94,8 +138,8 @@ async def update_user(
     )
 
 
-@router.delete("/{id}", response_model=SuccessResponseSchema)
-async def remove_user(
+@sync_router.delete("/{id}", response_model=SuccessResponseSchema)
+def remove_user(
         *,
         db: Session = Depends(common.get_db),
         response: Response,
@@ -104,16 +148,19 @@ async def remove_user(
     """
     Update a user.
     """
-    user = user_repo.find(db, id=id)
-    if not user:
+    if not user_repo.delete_by_id(db, id):
         return error_response(
             response=response,
             message="User not found!",
         )
 
-    user_repo.remove(db, id=id, model=user)
     return success_response(
         message="Remove user successfully!",
         data=None,
         response=response,
     )
+
+
+router = APIRouter()
+router.include_router(sync_router)
+router.include_router(async_router)
@@ -6,9 +6,10 @@ from pydantic.networks import EmailStr
 from app import models, schemas
 from app.core.celery_app import celery_app
 from app.core.mail import send_test_email
+from app.core.unit_of_work import UnitOfWorkRoute
 from app.dependency import common
 
-router = APIRouter()
+router = APIRouter(route_class=UnitOfWorkRoute)
 
 
 @router.post("/test-celery/", response_model=schemas.Msg, status_code=201)
@@ -45,12 +45,17 @@ class UserResponse(ResponseSchema):
     data: Optional[UserInfo]
 
 
+class UsersResponse(ResponseSchema):
+    data: List[UserInfo]
+
+
 # endregion
 
 # region datatable
 class UserRecord(UserInfo):
     full_name_extra: Optional[str]
-    stt: int
+    # `None` in keyset pagination
+    stt: Optional[int]
 
 
 class UserDataTableResult(DataTableResult):
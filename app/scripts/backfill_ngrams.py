@@ -0,0 +1,49 @@
+import logging
+
+from sqlalchemy import insert
+
+# models declare their n-gram columns, import all of them
+import app.db.base  # noqa: F401
+from app.core.ngram import ngram_columns, ngram_models, ngram_rows
+from app.core.repository import BaseRepository
+from app.db.session import SessionLocal
+from app.models.search_ngram import SearchNgram
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+
+
+def backfill(model) -> int:
+    db = SessionLocal()
+    columns = ngram_columns(model)
+    table_name = model.__table__.name
+    total = 0
+    try:
+        db.query(SearchNgram).filter(SearchNgram.table_name == table_name).delete(synchronize_session=False)
+        # n-grams are inserted between chunks, a streaming cursor can't share the connection
+        for records in BaseRepository(model).iterate_keyset(db, chunk_size=CHUNK_SIZE):
+            rows = [row for record in records for row in ngram_rows(record, columns)]
+            if rows:
+                db.execute(insert(SearchNgram), rows)
+            total += len(records)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    return total
+
+
+def main() -> None:
+    for model in ngram_models():
+        logger.info(f"Indexing n-grams of {model.__name__} ({', '.join(sorted(ngram_columns(model)))})")
+        total = backfill(model)
+        logger.info(f"Indexed {total} {model.__name__} records")
+
+
+if __name__ == "__main__":
+    main()
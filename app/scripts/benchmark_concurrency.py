@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Tuple
+
+from app.core import security
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.user import User
+from main import app
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = 200
+REQUESTS = 2000
+
+
+async def call(path: str, query: str, headers: Dict[str, str]) -> int:
+    """
+    One request straight through the ASGI app, no server nor HTTP client in the measure.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(key.lower().encode(), value.encode()) for key, value in headers.items()],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def measure(path: str, query: str, headers: Dict[str, str]) -> Tuple[float, int]:
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def limited() -> int:
+        async with semaphore:
+            return await call(path, query, headers)
+
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*(limited() for _ in range(REQUESTS)))
+    seconds = time.perf_counter() - started
+    return REQUESTS / seconds, sum(1 for status in statuses if status != 200)
+
+
+async def run(user_id: int) -> None:
+    headers = {"Authorization": f"Bearer {security.create_access_token(user_id)}"}
+    # same row, read by the async stack on the event loop and by the sync stack in the threadpool
+    for name, path, query in [
+        ("async GET /users/{id}", f"{settings.API_STR}/users/{user_id}", ""),
+        ("sync GET /users/?ids={id}", f"{settings.API_STR}/users/", f"ids={user_id}"),
+    ]:
+        await measure(path, query, headers)  # warm up pools and caches
+        rate, failures = await measure(path, query, headers)
+        logger.info(f"{name}: {rate:,.0f} requests/s at concurrency {CONCURRENCY} ({failures} failures)")
+
+
+def main() -> None:
+    db = SessionLocal()
+    try:
+        user_id = db.query(User.id).order_by(User.id).limit(1).scalar()
+    finally:
+        db.close()
+    if user_id is None:
+        raise SystemExit("No user to read, run `initial_data` first")
+
+    asyncio.run(run(user_id))
+
+
+if __name__ == "__main__":
+    main()
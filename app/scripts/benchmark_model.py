@@ -0,0 +1,37 @@
+import logging
+import timeit
+
+from app.models.user import User
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NUMBER = 20000
+
+ROW = dict(
+    id=1,
+    username="user1",
+    password="secret",
+    full_name="User One",
+    email="user1@example.com",
+    phone="0900000001",
+    is_admin=False,
+)
+CHANGES = dict(full_name="User Changed", phone="0900000002", email="user1@example.com")
+
+
+def hydrate_and_fill():
+    user = User(**ROW)
+    user.fill(CHANGES)
+    # datatable index column, not a mapped attribute
+    user.stt = 1
+    return user.is_dirty("full_name")
+
+
+def main() -> None:
+    seconds = min(timeit.repeat(hydrate_and_fill, number=NUMBER, repeat=3))
+    logger.info(f"hydrate and fill: {NUMBER / seconds:,.0f} records/s ({seconds / NUMBER * 1e6:.1f}µs per record)")
+
+
+if __name__ == "__main__":
+    main()
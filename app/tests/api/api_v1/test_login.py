@@ -1,8 +1,11 @@
 from typing import Dict
 
 from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
 
 from app.core.config import settings
+from app.core.security import generate_password_reset_token
+from app.tests.utils.user import create_random_user
 
 
 def test_get_access_token(client: TestClient) -> None:
@@ -26,3 +29,12 @@ def test_use_access_token(
     result = r.json()
     assert r.status_code == 200
     assert "email" in result
+
+
+def test_password_reset_token_is_not_an_access_token(client: TestClient, db: Session) -> None:
+    user = create_random_user(db)
+    # signed with the same key, its `sub` is an email
+    headers = {"Authorization": f"Bearer {generate_password_reset_token(user.email)}"}
+    for path in [f"{settings.API_STR}/users/{user.id}", f"{settings.API_STR}/users/"]:
+        r = client.get(path, headers=headers)
+        assert r.status_code == 403
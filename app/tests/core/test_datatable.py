@@ -0,0 +1,338 @@
+import asyncio
+import csv
+import io
+from typing import Any, List, Type
+
+import pytest
+from fastapi import Response
+from sqlalchemy import inspect
+from sqlalchemy.orm import Query as SQLQuery, Session
+
+from app.core.datatable import Action, ApproximateCount, BaseDataTable, CachedCount, CountStrategy, DataTableCache, \
+    DataTableColumn, DataTableRecord, Pagination, Projection, TrackedCount, WordMatch, decode_cursor, encode_cursor
+from app.core.response import BadPayloadException
+from app.models.partner import Partner
+from app.models.user import User
+from app.repositories.user import user_repo
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import capture_statements, random_lower_string
+
+
+def test_cursor_round_trip() -> None:
+    for value in [1, 123456789012, "abc", 1.5]:
+        assert decode_cursor(encode_cursor(value)) == value
+
+
+def test_invalid_cursor() -> None:
+    with pytest.raises(BadPayloadException):
+        decode_cursor("not-a-cursor")
+
+
+class UserEmailDataTable(BaseDataTable):
+    def modified_datatable(self):
+        self.add_batch_column('db_email', self.load_emails)
+
+    @staticmethod
+    def load_emails(records: List[Any], datatable: BaseDataTable) -> List[str]:
+        # one query for the whole page, through the session of the rendering request
+        ids = [record.id for record in records]
+        emails = dict(datatable.session.query(User.id, User.email).filter(User.id.in_(ids)).all())
+        return [emails[record.id] for record in records]
+
+    def query(self) -> SQLQuery:
+        return self.session.query(User)
+
+    @staticmethod
+    def get_columns() -> List[DataTableColumn]:
+        return [
+            DataTableColumn(data=User.id, orderable=True),
+            DataTableColumn(data=User.email, searchable=True),
+        ]
+
+
+class UserEmailExportDataTable(UserEmailDataTable):
+    @staticmethod
+    def get_columns() -> List[DataTableColumn]:
+        return [
+            DataTableColumn(data=User.id, orderable=True, exportable=True),
+            DataTableColumn(data=User.full_name, searchable=True),
+            DataTableColumn(data='db_email', exportable=True),
+        ]
+
+
+async def read_export(datatable: BaseDataTable, db: Session) -> List[List[str]]:
+    response = await datatable.render(db, Response())
+    body = "".join([chunk async for chunk in response.body_iterator])
+    return list(csv.reader(io.StringIO(body)))
+
+
+def test_export_batch_producer_queries_session(db: Session) -> None:
+    full_name = random_lower_string()
+    users = [create_random_user(db, full_name=full_name) for _ in range(5)]
+    # several chunks, the producer queries the session while the rows are still streaming
+    datatable = UserEmailExportDataTable(request=None, keyword=full_name, action=Action.CSV, export_chunk_size=2)
+    rows = asyncio.run(read_export(datatable, db))
+    assert rows[1:] == [[str(user.id), user.email] for user in sorted(users, key=lambda user: user.id)]
+
+
+def test_batch_producer_queries_session(db: Session) -> None:
+    user = create_random_user(db)
+    datatable = UserEmailDataTable(request=None, keyword=user.email)
+    result = asyncio.run(datatable.render(db, Response()))
+    items = result["data"]["items"]
+    assert [item.db_email for item in items] == [user.email]
+
+
+class UserSearchDataTable(BaseDataTable):
+    def modified_datatable(self):
+        self.add_index_column('stt')
+
+    def query(self) -> SQLQuery:
+        return self.session.query(User)
+
+    @staticmethod
+    def get_columns() -> List[DataTableColumn]:
+        return [
+            DataTableColumn(data=User.id, orderable=True),
+            DataTableColumn(data=User.username, searchable=True, orderable=True),
+            DataTableColumn(data=User.full_name, searchable=True, orderable=True),
+            DataTableColumn(data=User.email, searchable=True),
+        ]
+
+
+@pytest.mark.parametrize("count_strategy", [CountStrategy.WINDOW, CountStrategy.SEPARATE])
+def test_filtered_count_under_search(db: Session, count_strategy: CountStrategy) -> None:
+    matched = [create_random_user(db) for _ in range(2)]
+    create_random_user(db)
+    datatable = UserSearchDataTable(request=None, keyword=matched[0].full_name, count_strategy=count_strategy)
+    data = asyncio.run(datatable.render(db, Response()))["data"]
+    assert data["filteredRecords"] == 1
+    assert data["totalRecords"] >= 3
+    assert [item.id for item in data["items"]] == [matched[0].id]
+
+
+@pytest.mark.parametrize("sort", ["unknown", "email", "id,-id"])
+def test_invalid_sort(db: Session, sort: str) -> None:
+    create_random_user(db)
+    with pytest.raises(BadPayloadException):
+        asyncio.run(UserSearchDataTable(request=None, sort=sort).render(db, Response()))
+
+
+def test_strict_ordering_rejects_unindexed_sort(db: Session) -> None:
+    create_random_user(db)
+    asyncio.run(UserSearchDataTable(request=None, sort="-username", strict_ordering=True).render(db, Response()))
+    with pytest.raises(BadPayloadException):
+        asyncio.run(UserSearchDataTable(request=None, sort="full_name", strict_ordering=True).render(db, Response()))
+
+
+@pytest.mark.parametrize("word_match", [WordMatch.ALL, WordMatch.ANY])
+def test_search_words_across_columns(db: Session, word_match: WordMatch) -> None:
+    first_word, last_word = random_lower_string(), random_lower_string()
+    # one word in each column of the same row
+    both = create_random_user(db, username=first_word, full_name=last_word)
+    last_only = create_random_user(db, username=random_lower_string(), full_name=last_word)
+    datatable = UserSearchDataTable(request=None, keyword=f"{first_word} {last_word}", word_match=word_match)
+    items = asyncio.run(datatable.render(db, Response()))["data"]["items"]
+    expected = [both.id] if word_match == WordMatch.ALL else [both.id, last_only.id]
+    assert [item.id for item in items] == expected
+
+
+def test_debug_sql(db: Session) -> None:
+    user = create_random_user(db)
+    datatable = UserSearchDataTable(request=None, keyword=user.full_name, debug_sql=True)
+    debug = asyncio.run(datatable.render(db, Response()))["data"]["others"]["debug"]
+    assert debug
+    assert all("explain" in item for item in debug if item["sql"].startswith("SELECT"))
+
+
+def test_index_column(db: Session) -> None:
+    full_name = random_lower_string()
+    for _ in range(3):
+        create_random_user(db, username=random_lower_string(), full_name=full_name)
+    datatable = UserSearchDataTable(request=None, keyword=full_name, page=2, limit=2)
+    items = asyncio.run(datatable.render(db, Response()))["data"]["items"]
+    assert [item.stt for item in items] == [3]
+
+    datatable = UserSearchDataTable(request=None, keyword=full_name, limit=2, pagination=Pagination.KEYSET)
+    data = asyncio.run(datatable.render(db, Response()))["data"]
+    datatable = UserSearchDataTable(
+        request=None, keyword=full_name, limit=2, after=data["nextCursor"], pagination=Pagination.KEYSET
+    )
+    items = asyncio.run(datatable.render(db, Response()))["data"]["items"]
+    # a keyset page doesn't know its position
+    assert [item.stt for item in items] == [None]
+
+
+def count_statements(statements: List[str]) -> List[str]:
+    return [statement for statement in statements if "count(" in statement.lower()]
+
+
+def test_cached_count(db: Session) -> None:
+    count_provider = CachedCount(ttl=60)
+    total = asyncio.run(UserSearchDataTable(request=None, count_provider=count_provider).render(db, Response()))
+    create_random_user(db)
+    with capture_statements(db) as statements:
+        datatable = UserSearchDataTable(request=None, count_provider=count_provider)
+        data = asyncio.run(datatable.render(db, Response()))["data"]
+    # served from the cache until `ttl`, the new row isn't counted yet
+    assert data["totalRecords"] == total["data"]["totalRecords"]
+    assert not count_statements(statements)
+
+    count_provider.cache.clear()
+    data = asyncio.run(UserSearchDataTable(request=None, count_provider=count_provider).render(db, Response()))["data"]
+    assert data["totalRecords"] == total["data"]["totalRecords"] + 1
+
+
+def test_tracked_count(db: Session) -> None:
+    count_provider = TrackedCount()
+    total = asyncio.run(
+        UserSearchDataTable(request=None, count_provider=count_provider).render(db, Response())
+    )["data"]["totalRecords"]
+    removed = create_random_user(db)
+    create_random_user(db)
+    user_repo.remove(db, id=removed.id)
+    with capture_statements(db) as statements:
+        datatable = UserSearchDataTable(request=None, count_provider=count_provider)
+        data = asyncio.run(datatable.render(db, Response()))["data"]
+    # creates and removes of the repository move the counter, no count query
+    assert data["totalRecords"] == total + 1
+    assert not count_statements(statements)
+
+
+class NormalUserDataTable(UserSearchDataTable):
+    def query(self) -> SQLQuery:
+        return self.session.query(User).filter(User.is_admin != True)  # noqa
+
+
+def test_tracked_count_rejects_filtered_query(db: Session) -> None:
+    datatable = NormalUserDataTable(request=None)
+    datatable.session = db
+    datatable.query_statement = datatable.query()
+    with pytest.raises(ValueError):
+        TrackedCount().count(datatable)
+
+
+def test_approximate_count(db: Session) -> None:
+    create_random_user(db)
+    exact = asyncio.run(UserSearchDataTable(request=None).render(db, Response()))["data"]["totalRecords"]
+    # below `exact_below` the estimate is replaced by an exact count
+    datatable = UserSearchDataTable(request=None, count_provider=ApproximateCount(exact_below=exact + 1))
+    assert asyncio.run(datatable.render(db, Response()))["data"]["totalRecords"] == exact
+
+    datatable = UserSearchDataTable(request=None, count_provider=ApproximateCount(exact_below=0))
+    assert asyncio.run(datatable.render(db, Response()))["data"]["totalRecords"] >= 0
+
+
+def test_without_count(db: Session) -> None:
+    full_name = random_lower_string()
+    users = [create_random_user(db, username=random_lower_string(), full_name=full_name) for _ in range(3)]
+    with capture_statements(db) as statements:
+        datatable = UserSearchDataTable(request=None, keyword=full_name, limit=2, count=False)
+        data = asyncio.run(datatable.render(db, Response()))["data"]
+    assert not count_statements(statements)
+    assert data["totalRecords"] is None
+    assert data["hasMore"] is True
+    assert [item.id for item in data["items"]] == [user.id for user in users[:2]]
+
+    datatable = UserSearchDataTable(request=None, keyword=full_name, page=2, limit=2, count=False)
+    data = asyncio.run(datatable.render(db, Response()))["data"]
+    assert data["hasMore"] is False
+    assert [item.id for item in data["items"]] == [users[2].id]
+
+
+def test_result_cache_key() -> None:
+    def key(**kwargs) -> Any:
+        return DataTableCache.key(UserSearchDataTable(request=None, **kwargs))
+
+    # word order and duplicates don't matter to a smart search, nor does blank space in `sort`
+    assert key(keyword="john doe", sort="id,-username") == key(keyword="doe john john", sort=" id , -username")
+    assert key(keyword="john doe", smart_search=False) != key(keyword="doe john", smart_search=False)
+    assert key(page=1) != key(page=2)
+    assert key(count=True) != key(count=False)
+
+
+def test_result_cache_invalidated_by_write(db: Session) -> None:
+    result_cache = DataTableCache(ttl=60)
+
+    def render() -> Response:
+        response = Response()
+        asyncio.run(UserSearchDataTable(request=None, result_cache=result_cache).render(db, response))
+        return response
+
+    create_random_user(db)
+    assert render().headers["X-Cache"] == "MISS"
+    assert render().headers["X-Cache"] == "HIT"
+    create_random_user(db)
+    assert render().headers["X-Cache"] == "MISS"
+
+
+def test_result_cache_skips_stale_render() -> None:
+    result_cache = DataTableCache(ttl=60)
+    datatable = UserSearchDataTable(request=None)
+    generation = result_cache.generation(UserSearchDataTable)
+    # a write lands while the page renders
+    result_cache.invalidate(UserSearchDataTable)
+    result_cache.set(datatable, {"items": []}, generation)
+    assert result_cache.get(datatable) is None
+
+    result_cache.set(datatable, {"items": []}, result_cache.generation(UserSearchDataTable))
+    assert result_cache.get(datatable) == {"items": []}
+
+
+class PartnerDataTable(BaseDataTable):
+    def modified_datatable(self):
+        self.add_column('label', lambda record: f"{record.name} ({record.tax_code})", requires=[Partner.tax_code])
+
+    def query(self) -> SQLQuery:
+        return self.session.query(Partner)
+
+    @staticmethod
+    def get_columns() -> List[DataTableColumn]:
+        return [
+            DataTableColumn(data=Partner.name, searchable=True),
+            DataTableColumn(data=Partner.code, orderable=True),
+            DataTableColumn(data='label'),
+        ]
+
+
+class PartnerDescriptionDataTable(PartnerDataTable):
+    @staticmethod
+    def get_columns() -> List[DataTableColumn]:
+        return PartnerDataTable.get_columns() + [DataTableColumn(data=Partner.description, searchable=True)]
+
+
+def create_random_partner(db: Session, name: str) -> Partner:
+    partner = Partner(
+        code=random_lower_string(), name=name, tax_code=random_lower_string(), description=random_lower_string()
+    )
+    db.add(partner)
+    db.commit()
+    return partner
+
+
+def render_partners(db: Session, datatable_cls: Type[BaseDataTable], projection: Projection) -> List[Any]:
+    name = random_lower_string()
+    partner = create_random_partner(db, name)
+    datatable = datatable_cls(request=None, keyword=name, projection=projection)
+    items = asyncio.run(datatable.render(db, Response()))["data"]["items"]
+    assert [item.id for item in items] == [partner.id]
+    assert items[0].label == f"{partner.name} ({partner.tax_code})"
+    return items
+
+
+def test_projection_defined(db: Session) -> None:
+    record, = render_partners(db, PartnerDataTable, Projection.DEFINED)
+    assert isinstance(record, DataTableRecord)
+    # defined columns, the `requires` of `label` and the primary key
+    assert set(vars(record)) == {"id", "name", "code", "tax_code", "label"}
+
+
+def test_projection_scalar(db: Session) -> None:
+    record, = render_partners(db, PartnerDataTable, Projection.SCALAR)
+    assert isinstance(record, DataTableRecord)
+    # every column but the large `description`
+    assert set(vars(record)) == ({column.key for column in inspect(Partner).column_attrs} - {"description"}) | {"label"}
+
+    record, = render_partners(db, PartnerDescriptionDataTable, Projection.SCALAR)
+    # unless it is a defined column
+    assert "description" in vars(record)
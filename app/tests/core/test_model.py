@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+from app.repositories.user import user_repo
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
+
+
+def test_new_instance() -> None:
+    user = User(full_name="new")
+    # non-column attributes are ignored
+    user.stt = 1
+    assert user.is_dirty()
+    assert user.is_dirty("full_name")
+    assert not user.is_dirty("email")
+    assert not user.is_dirty("stt")
+    assert user.get_origin("full_name") is None
+    with pytest.raises(ValueError):
+        user.get_origin("stt")
+
+
+def loaded_user(db: Session) -> User:
+    user_id = create_random_user(db).id
+    db.expunge_all()
+    return db.get(User, user_id)
+
+
+def test_loaded_instance(db: Session) -> None:
+    user = loaded_user(db)
+    assert not user.is_dirty()
+
+    full_name = user.full_name
+    user.full_name = random_lower_string()
+    assert user.is_dirty()
+    assert user.is_dirty("full_name")
+    assert not user.is_dirty("email")
+    assert user.get_origin("full_name") == full_name
+    assert user.get_origin("email") == user.email
+
+
+def test_flushed_instance(db: Session) -> None:
+    user = loaded_user(db)
+    full_name = user.full_name
+    user.full_name = random_lower_string()
+    db.flush()
+    # a flush doesn't reset the changes, nor a second change their origin
+    user.full_name = random_lower_string()
+    db.flush()
+    assert user.is_dirty("full_name")
+    assert user.get_origin("full_name") == full_name
+    db.commit()
+
+    # nor does an update of the repository
+    email = user.email
+    user_repo.update(db, db_obj=user, obj_in={"email": random_lower_string()})
+    assert user.is_dirty("email")
+    assert user.get_origin("email") == email
+
+
+def test_expired_instance(db: Session) -> None:
+    user = loaded_user(db)
+    full_name = user.full_name
+    user.full_name = random_lower_string()
+    db.commit()
+    db.expire(user)
+    assert user.is_dirty("full_name")
+    assert user.get_origin("full_name") == full_name
+
+    # changes of the expired instance have no origin
+    user.email = random_lower_string()
+    assert user.is_dirty("email")
+    assert user.get_origin("email") is None
+
+    # an instance loaded again starts clean
+    user_id = user.id
+    db.commit()
+    db.expunge_all()
+    assert not db.get(User, user_id).is_dirty()
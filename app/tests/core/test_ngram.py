@@ -0,0 +1,77 @@
+from typing import Set
+
+from sqlalchemy.orm import Session
+
+from app.core.ngram import ngram_condition, ngrams
+from app.models.search_ngram import SearchNgram
+from app.models.user import User
+from app.repositories.user import user_repo
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import capture_statements, random_lower_string
+
+
+def random_phone() -> str:
+    return random_lower_string()[:12]
+
+
+def indexed_grams(db: Session, user_id: int) -> Set[str]:
+    rows = db.query(SearchNgram.gram).filter(
+        SearchNgram.table_name == User.__tablename__,
+        SearchNgram.column_name == "phone",
+        SearchNgram.record_id == user_id,
+    ).all()
+    return {gram for gram, in rows}
+
+
+def test_ngrams() -> None:
+    assert ngrams("AbcD") == {"abc", "bcd"}
+    assert ngrams("ab") == set()
+    assert ngrams(None) == set()
+
+
+def test_index_on_create(db: Session) -> None:
+    phone = random_phone()
+    with capture_statements(db) as statements:
+        user = create_random_user(db, phone=phone)
+    assert indexed_grams(db, user.id) == ngrams(phone)
+    # a new record has nothing to unindex, its grams are one executemany
+    assert not [statement for statement in statements if statement.startswith("DELETE")]
+    assert len([statement for statement in statements if statement.startswith("INSERT INTO search_ngrams")]) == 1
+
+
+def test_index_on_update(db: Session) -> None:
+    user = create_random_user(db, phone=random_phone())
+    phone = random_phone()
+    user_repo.update(db, db_obj=user, obj_in={"phone": phone})
+    assert indexed_grams(db, user.id) == ngrams(phone)
+
+    # other columns keep the grams
+    user_repo.update(db, db_obj=user, obj_in={"full_name": random_lower_string()})
+    assert indexed_grams(db, user.id) == ngrams(phone)
+
+
+def test_unindex_on_delete(db: Session) -> None:
+    removed, deleted, kept = [create_random_user(db, phone=random_phone()) for _ in range(3)]
+    user_repo.remove(db, id=removed.id)
+    user_repo.delete_by_id(db, deleted.id)
+    assert indexed_grams(db, removed.id) == set()
+    assert indexed_grams(db, deleted.id) == set()
+
+    user_repo.delete_where(db, User.id == kept.id)
+    assert indexed_grams(db, kept.id) == set()
+
+
+def test_ngram_condition(db: Session) -> None:
+    phone = random_phone()
+    user = create_random_user(db, phone=phone)
+
+    def found(keyword: str) -> bool:
+        return db.query(User.id).filter(User.id == user.id, ngram_condition(User.phone, keyword)).first() is not None
+
+    assert found(phone[3:9])
+    assert found(phone[3:9].upper())
+    # shorter than a gram, falls back to the substring condition
+    assert found(phone[4:6])
+    # every gram is indexed, but they aren't adjacent
+    assert not found(phone[:3] + phone[6:9])
+    assert not found(random_lower_string()[:6])
@@ -0,0 +1,95 @@
+import asyncio
+import io
+from typing import List
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from fastapi import Response
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import Query as SQLQuery, Session
+
+from app.core.datatable import BaseDataTable, DataTableColumn
+from app.core.search import SearchIndex, SearchMode, create_search_indexes, escape_like, fulltext_terms, \
+    search_indexes, substring_condition
+from app.models.user import User
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
+
+
+class UserPrefixDataTable(BaseDataTable):
+    def modified_datatable(self):
+        pass
+
+    def query(self) -> SQLQuery:
+        return self.session.query(User)
+
+    @staticmethod
+    def get_columns() -> List[DataTableColumn]:
+        return [
+            DataTableColumn(data=User.id, orderable=True),
+            DataTableColumn(data=User.username, searchable=True, search=SearchMode.PREFIX),
+            DataTableColumn(data=User.full_name, searchable=True, search=SearchMode.PREFIX),
+            DataTableColumn(data=User.email, searchable=True, search=SearchMode.FULLTEXT),
+            DataTableColumn(data=User.phone, searchable=True, search=SearchMode.FULLTEXT),
+        ]
+
+
+def test_escape_like(db: Session) -> None:
+    assert escape_like("50%_off\\") == "50\\%\\_off\\\\"
+
+    prefix = random_lower_string()
+    literal = create_random_user(db, full_name=f"{prefix}%_x")
+    create_random_user(db, full_name=f"{prefix}abx")
+    # wildcards of the keyword match themselves only
+    users = db.query(User.id).filter(substring_condition(User.full_name, f"{prefix}%_")).all()
+    assert [user_id for user_id, in users] == [literal.id]
+
+
+def test_prefix_search(db: Session) -> None:
+    user = create_random_user(db, username=random_lower_string())
+
+    def search(keyword: str) -> List[int]:
+        datatable = UserPrefixDataTable(request=None, keyword=keyword)
+        return [item.id for item in asyncio.run(datatable.render(db, Response()))["data"]["items"]]
+
+    assert search(user.username[:8]) == [user.id]
+    assert search(user.username[:8].upper()) == [user.id]
+    # the start of the value only
+    assert user.id not in search(user.username[4:12])
+
+
+def test_fulltext_terms() -> None:
+    # boolean mode operators of the keyword are dropped, each word is a prefix
+    assert fulltext_terms(["john +smith", "(doe)"]) == "john* smith* doe*"
+    assert fulltext_terms(["john", "smith"], required=True) == "+john* +smith*"
+
+
+def test_fulltext_short_word_fallback() -> None:
+    columns = [User.email, User.phone]
+    conditions = BaseDataTable._fulltext_conditions(columns, ["john", "ab"], required=True)
+    sql = [
+        str(condition.compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True}))
+        for condition in conditions
+    ]
+    # words shorter than the indexed tokens can't be matched by the FULLTEXT index
+    assert sql[0] == "MATCH (users.email, users.phone) AGAINST ('+john*' IN BOOLEAN MODE)"
+    assert "MATCH" not in sql[1]
+    assert "%%ab%%" in sql[1] and "users.email" in sql[1] and "users.phone" in sql[1]
+
+
+def test_search_indexes() -> None:
+    # `username` is unique, so indexed already
+    assert search_indexes(UserPrefixDataTable) == [
+        SearchIndex("ix_users_full_name", "users", ["full_name"]),
+        SearchIndex("ft_users_search", "users", ["email", "phone"], fulltext=True),
+    ]
+
+
+def test_create_search_indexes() -> None:
+    buffer = io.StringIO()
+    context = MigrationContext.configure(dialect_name="mysql", opts={"as_sql": True, "output_buffer": buffer})
+    with Operations.context(context):
+        create_search_indexes(UserPrefixDataTable)
+    sql = buffer.getvalue()
+    assert "CREATE INDEX ix_users_full_name ON users (full_name)" in sql
+    assert "CREATE FULLTEXT INDEX ft_users_search ON users (email, phone)" in sql
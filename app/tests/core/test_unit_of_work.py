@@ -0,0 +1,84 @@
+import pytest
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Response
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.core.response import error_response, init_app, success_response
+from app.core.unit_of_work import UnitOfWorkRoute
+from app.dependency import common
+from app.models.user import User
+from app.repositories.user import user_repo
+from app.schemas.user import UserCreateRequest
+from app.tests.utils.utils import random_lower_string
+
+router = APIRouter(route_class=UnitOfWorkRoute)
+
+
+def create_user(db: Session, username: str):
+    user_repo.create(db, obj_in=UserCreateRequest(username=username, password=random_lower_string(), full_name="UoW"))
+
+
+@router.post("/{username}/ok")
+def create_ok(username: str, response: Response, db: Session = Depends(common.get_db)):
+    create_user(db, username)
+    return success_response(response=response, message="", data=None)
+
+
+@router.post("/{username}/error")
+def create_error(username: str, response: Response, db: Session = Depends(common.get_db)):
+    create_user(db, username)
+    return error_response(response=response, message="Rejected")
+
+
+@router.post("/{username}/raise")
+def create_raise(username: str, db: Session = Depends(common.get_db)):
+    create_user(db, username)
+    raise HTTPException(status_code=400, detail="Rejected")
+
+
+@router.post("/{username}/crash")
+def create_crash(username: str, db: Session = Depends(common.get_db)):
+    create_user(db, username)
+    raise RuntimeError("Crashed")
+
+
+app = FastAPI()
+init_app(app)
+app.include_router(router)
+
+
+def user_exists(db: Session, username: str) -> bool:
+    db.rollback()  # a fresh snapshot, the requests ran in their own sessions
+    return db.query(User).filter(User.username == username).count() == 1
+
+
+def test_commit_on_success(db: Session) -> None:
+    username = random_lower_string()
+    with TestClient(app) as client:
+        r = client.post(f"/{username}/ok")
+    assert r.status_code == 200
+    assert user_exists(db, username)
+
+
+def test_rollback_on_error_response(db: Session) -> None:
+    username = random_lower_string()
+    with TestClient(app) as client:
+        r = client.post(f"/{username}/error")
+    assert r.status_code == 400
+    assert not user_exists(db, username)
+
+
+def test_rollback_on_http_exception(db: Session) -> None:
+    username = random_lower_string()
+    with TestClient(app) as client:
+        r = client.post(f"/{username}/raise")
+    assert r.status_code == 400
+    assert not user_exists(db, username)
+
+
+def test_rollback_on_server_error(db: Session) -> None:
+    username = random_lower_string()
+    with TestClient(app) as client:
+        with pytest.raises(RuntimeError):
+            client.post(f"/{username}/crash")
+    assert not user_exists(db, username)
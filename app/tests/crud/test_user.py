@@ -1,10 +1,22 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List
+
+import pytest
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy import inspect, update
 from sqlalchemy.orm import Session
 
 from app import repositories
+from app.core.cache import TTLCache
+from app.core.repository import BatchLoader
+from app.core.response import ConflictException
 from app.core.security import verify_password
+from app.models.user import User
+from app.repositories.user import UserRepository, user_repo
 from app.schemas.user import UserCreateRequest, UserUpdateRequest
-from app.tests.utils.utils import random_email, random_lower_string
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import capture_statements, random_email, random_lower_string
 
 
 def test_create_user(db: Session) -> None:
@@ -92,3 +104,234 @@ def test_update_user(db: Session) -> None:
     assert user_2
     assert user.email == user_2.email
     assert verify_password(new_password, user_2.hashed_password)
+
+
+def test_find_user_cached(db: Session) -> None:
+    repo = UserRepository(User, cache=TTLCache())
+    email = random_email()
+    user_in = UserCreateRequest(username=email, email=email, password=random_lower_string(), full_name="Cached")
+    user = repo.create(db, obj_in=user_in)
+    assert repo.find(db, id=user.id).email == email
+    assert repo.find_by_columns(db, id=str(user.id)).email == email
+    assert repo.cache.stats()["hits"] == 1
+
+    repo.update(db, db_obj=user, obj_in={"full_name": "Updated"})
+    assert repo.cache.stats()["size"] == 0
+    assert repo.find(db, id=user.id).full_name == "Updated"
+
+
+def test_update_writes_dirty_columns_only(db: Session) -> None:
+    user = create_random_user(db)
+    with capture_statements(db) as statements:
+        user_repo.update(db, db_obj=user, obj_in={"full_name": "Updated", "email": user.email})
+        user_repo.update(db, db_obj=user, obj_in={"full_name": "Updated"})
+
+    updates = [statement for statement in statements if statement.startswith("UPDATE")]
+    assert len(updates) == 1
+    assert "full_name" in updates[0]
+    assert "email" not in updates[0]
+
+
+def test_update_conflict(db: Session) -> None:
+    repo = UserRepository(User, optimistic_lock=True)
+    user = create_random_user(db)
+    assert user.updated_at is not None
+    # a concurrent writer changed the row since `updated_at` was loaded
+    db.execute(update(User.__table__).where(User.__table__.c.id == user.id).values(updated_at=datetime(2000, 1, 1)))
+    with pytest.raises(ConflictException):
+        repo.update(db, db_obj=user, obj_in={"full_name": "Mine"})
+
+
+def test_update_lock_needs_loaded_updated_at(db: Session) -> None:
+    repo = UserRepository(User, optimistic_lock=True)
+    user = create_random_user(db)
+    db.expire(user, ["updated_at"])
+    # it would be read now and always match
+    with pytest.raises(ValueError):
+        repo.update(db, db_obj=user, obj_in={"full_name": "Mine"})
+
+
+def test_delete_by_id(db: Session) -> None:
+    user = create_random_user(db)
+    assert user_repo.exists(db, username=user.username)
+    assert user_repo.delete_by_id(db, user.id) == 1
+    assert not user_repo.exists(db, username=user.username)
+    assert user_repo.delete_by_id(db, user.id) == 0
+
+
+def test_delete_where(db: Session) -> None:
+    full_name = random_lower_string()
+    users = [create_random_user(db) for _ in range(3)]
+    for user in users[:2]:
+        user_repo.update(db, db_obj=user, obj_in={"full_name": full_name})
+    assert user_repo.delete_where(db, User.full_name == full_name) == 2
+    assert not user_repo.exists(db, full_name=full_name)
+    assert user_repo.exists(db, id=users[2].id)
+    with pytest.raises(ValueError):
+        user_repo.delete_where(db)
+
+
+@pytest.mark.parametrize("chunk_size, sizes", [(2, [2, 2]), (3, [3, 1]), (5, [4])])
+def test_iterate(db: Session, chunk_size: int, sizes: List[int]) -> None:
+    full_name = random_lower_string()
+    users = [create_random_user(db, full_name=full_name) for _ in range(4)]
+    chunks = list(user_repo.iterate(db, User.full_name == full_name, chunk_size=chunk_size))
+    assert [len(chunk) for chunk in chunks] == sizes
+    assert sorted(user.id for chunk in chunks for user in chunk) == sorted(user.id for user in users)
+    assert all(inspect(user).detached for chunk in chunks for user in chunk)
+    assert list(user_repo.iterate(db, User.full_name == random_lower_string())) == []
+
+
+@pytest.mark.parametrize("chunk_size, sizes", [(2, [2, 2]), (3, [3, 1]), (5, [4])])
+def test_iterate_keyset(db: Session, chunk_size: int, sizes: List[int]) -> None:
+    full_name = random_lower_string()
+    users = [create_random_user(db, full_name=full_name) for _ in range(4)]
+    chunks = []
+    for chunk in user_repo.iterate_keyset(db, User.full_name == full_name, chunk_size=chunk_size):
+        chunks.append(chunk)
+        # nothing is held open between chunks
+        user_repo.update(db, db_obj=db.merge(chunk[0]), obj_in={"is_admin": True})
+    assert [len(chunk) for chunk in chunks] == sizes
+    assert [user.id for chunk in chunks for user in chunk] == sorted(user.id for user in users)
+    assert all(inspect(user).detached for chunk in chunks for user in chunk)
+    assert list(user_repo.iterate_keyset(db, User.full_name == random_lower_string())) == []
+
+
+def test_find_many_filtered(db: Session) -> None:
+    repo = UserRepository(User, cache=TTLCache())
+    users = [create_random_user(db) for _ in range(2)]
+    repo.update(db, db_obj=users[0], obj_in={"is_admin": True})
+    ids = [user.id for user in users]
+    assert [user.id for user in repo.find_many(db, ids)] == ids
+    # cached now, the filter must still be applied
+    assert [user.id for user in repo.find_many(db, ids, User.is_admin != True)] == ids[1:]
+
+
+def test_update_cached_copy(db: Session) -> None:
+    repo = UserRepository(User, cache=TTLCache())
+    user = create_random_user(db, full_name="Cached")
+    user_id = user.id
+    db.expunge_all()
+    repo.find(db, id=user_id)
+    # another worker changes the row, this process' cache isn't told
+    db.execute(update(User.__table__).where(User.__table__.c.id == user_id).values(full_name="Other"))
+    db.commit()
+    db.expunge_all()
+
+    cached = repo.find(db, id=user_id)
+    assert cached.full_name == "Cached"
+    repo.update(db, db_obj=cached, obj_in={"full_name": "Cached"})
+    assert db.query(User.full_name).filter(User.id == user_id).scalar() == "Cached"
+
+
+def test_find_cached_keeps_loaded_instance(db: Session) -> None:
+    repo = UserRepository(User, cache=TTLCache())
+    user = create_random_user(db)
+    repo.find(db, id=user.id)
+    user.full_name = "Pending"
+    assert repo.find(db, id=user.id) is user
+    assert user.full_name == "Pending"
+
+
+def random_user_rows(count: int, **kwargs) -> List[Dict[str, Any]]:
+    rows = []
+    for _ in range(count):
+        email = random_email()
+        rows.append({"username": email, "email": email, "password": "secret", "full_name": "Bulk", **kwargs})
+    return rows
+
+
+def test_create_many(db: Session) -> None:
+    full_name = random_lower_string()
+    with capture_statements(db) as statements:
+        assert user_repo.create_many(db, random_user_rows(3, full_name=full_name), chunk_size=2) == 3
+
+    inserts = [statement for statement in statements if statement.startswith("INSERT INTO users")]
+    # one executemany per chunk, with every value bound so pymysql sends multi-row VALUES
+    assert len(inserts) == 2
+    assert not [statement for statement in inserts if "now()" in statement.lower() or "current" in statement.lower()]
+    users = db.query(User).filter(User.full_name == full_name).all()
+    assert len(users) == 3
+    assert all(user.created_at is not None and user.password != "secret" for user in users)
+
+
+def test_update_many(db: Session) -> None:
+    users = [create_random_user(db) for _ in range(2)]
+    rows = [{"id": users[0].id, "full_name": "First"}, {"id": users[1].id, "full_name": "Second", "is_admin": True}]
+    assert user_repo.update_many(db, rows) == 2
+    db.expire_all()
+    assert [(user.full_name, user.is_admin) for user in users] == [("First", False), ("Second", True)]
+
+
+def test_upsert_many(db: Session) -> None:
+    user = create_random_user(db)
+    rows = random_user_rows(1)
+    rows.append({"username": user.username, "email": user.email, "password": "secret", "full_name": "Upserted"})
+    # keyed by `username`: the first unique key every row gives
+    assert user_repo.upsert_many(db, rows) == 2
+    db.expire_all()
+    assert user.full_name == "Upserted"
+    assert user_repo.exists(db, username=rows[0]["username"])
+
+    with pytest.raises(ValueError):
+        user_repo.upsert_many(db, rows, index_elements=["full_name"])
+    with pytest.raises(ValueError):
+        user_repo.upsert_many(db, rows, index_elements=["id"])
+
+
+def test_unique_key() -> None:
+    assert user_repo.unique_keys == [("id",), ("username",), ("email",), ("phone",)]
+    assert user_repo._unique_key([{"id": 1, "username": "a"}], None) == ("id",)
+    assert user_repo._unique_key([{"username": "a", "email": "b"}, {"email": "c"}], None) == ("email",)
+    assert user_repo._unique_key([{"username": "a", "email": "b"}], ["email"]) == ("email",)
+    with pytest.raises(ValueError):
+        user_repo._unique_key([{"username": "a"}, {"full_name": "b"}], None)
+
+
+def test_hash_passwords() -> None:
+    rows = UserRepository._hash_passwords([{"password": "secret"}, UserUpdateRequest(full_name="No password")])
+    assert verify_password("secret", rows[0]["password"])
+    assert rows[1] == {"full_name": "No password"}
+
+
+def test_batch_loader(db: Session, monkeypatch: pytest.MonkeyPatch) -> None:
+    users = [create_random_user(db) for _ in range(3)]
+    find_many = user_repo.find_many
+    calls: List[List[Any]] = []
+
+    def spy(db: Session, ids: List[Any], *filter_conditions: Any) -> List[User]:
+        calls.append(list(ids))
+        return find_many(db, ids, *filter_conditions)
+
+    monkeypatch.setattr(user_repo, "find_many", spy)
+    loader = BatchLoader(user_repo, db)
+
+    async def load() -> List[Any]:
+        return await asyncio.gather(*(loader.load(id) for id in [users[0].id, users[1].id, users[0].id, -1]))
+
+    assert asyncio.run(load()) == [users[0], users[1], users[0], None]
+    # concurrent loads share one query, duplicates are only asked once
+    assert calls == [[users[0].id, users[1].id, -1]]
+
+    # loaded ids are cached for the session
+    assert asyncio.run(loader.load_many([users[1].id, users[2].id])) == [users[1], users[2]]
+    assert calls[1:] == [[users[2].id]]
+
+
+def test_batch_loader_error(db: Session, monkeypatch: pytest.MonkeyPatch) -> None:
+    user = create_random_user(db)
+
+    def fail(db: Session, ids: List[Any], *filter_conditions: Any) -> List[User]:
+        raise RuntimeError("find_many failed")
+
+    loader = BatchLoader(user_repo, db)
+    with monkeypatch.context() as patch:
+        patch.setattr(user_repo, "find_many", fail)
+
+        async def load() -> List[Any]:
+            return await asyncio.gather(loader.load(user.id), loader.load(-1), return_exceptions=True)
+
+        assert [str(error) for error in asyncio.run(load())] == ["find_many failed"] * 2
+
+    # failed loads aren't cached
+    assert asyncio.run(loader.load(user.id)) == user
@@ -0,0 +1,81 @@
+from typing import List
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import Engine
+
+from app.db.routing import ReplicaSet, RoutingSession
+from app.db.session import engine
+from app.models.partner import Partner
+from app.models.user import User
+from app.tests.utils.user import create_random_user
+
+
+def replica_engines(count: int) -> List[Engine]:
+    # other engines to the primary server, routing only tells them apart
+    return [create_engine(engine.url) for _ in range(count)]
+
+
+def unreachable_engine() -> Engine:
+    return create_engine(engine.url.set(host="127.0.0.1", port=1))
+
+
+def routing_session(replicas: ReplicaSet) -> RoutingSession:
+    return RoutingSession(bind=engine, replicas=replicas, autoflush=False)
+
+
+def test_reads_go_to_replica() -> None:
+    replica, = replica_engines(1)
+    db = routing_session(ReplicaSet([replica]))
+    assert db.get_bind(clause=select(User)) is replica
+    assert db.get_bind(clause=User.__table__.update().values(full_name="")) is engine
+
+
+def test_session_sticks_to_one_replica() -> None:
+    replicas = ReplicaSet(replica_engines(2))
+    first, second = routing_session(replicas), routing_session(replicas)
+    assert first.get_bind(clause=select(User)) is first.get_bind(clause=select(Partner))
+    # round-robin across sessions
+    assert first.get_bind(clause=select(User)) is not second.get_bind(clause=select(User))
+
+
+def test_primary_after_write() -> None:
+    replicas = ReplicaSet(replica_engines(1))
+    db = routing_session(replicas)
+    create_random_user(db)
+    # the session reads its own writes, whatever the table
+    assert db.get_bind(clause=select(User)) is engine
+    assert db.get_bind(clause=select(Partner)) is engine
+
+
+def test_using_primary() -> None:
+    replica, = replica_engines(1)
+    db = routing_session(ReplicaSet([replica]))
+    with db.using_primary():
+        assert db.get_bind(clause=select(User)) is engine
+    assert db.get_bind(clause=select(User)) is replica
+
+
+def test_read_after_write() -> None:
+    replica, = replica_engines(1)
+    replicas = ReplicaSet([replica], read_after_write=60)
+    create_random_user(routing_session(replicas))
+    # replication lag, other sessions read the written table from the primary
+    db = routing_session(replicas)
+    assert db.get_bind(clause=select(User)) is engine
+    assert db.get_bind(clause=select(Partner)) is replica
+
+    replicas = ReplicaSet([replica], read_after_write=0)
+    create_random_user(routing_session(replicas))
+    assert routing_session(replicas).get_bind(clause=select(User)) is replica
+
+
+def test_unreachable_replica_falls_back_to_primary() -> None:
+    replica, unreachable = replica_engines(1)[0], unreachable_engine()
+    replicas = ReplicaSet([unreachable, replica])
+    db = routing_session(replicas)
+    user = create_random_user(routing_session(ReplicaSet([])))
+    assert db.get_bind(clause=select(User)) is unreachable
+    assert db.execute(select(User.id).where(User.id == user.id)).scalar() == user.id
+    assert not replicas.is_healthy(unreachable)
+    # the next read of the session picks a healthy replica
+    assert db.get_bind(clause=select(User)) is replica
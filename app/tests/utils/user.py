@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 from app import repositories
 from app.core.config import settings
 from app.models.user import User
+from app.repositories.user import user_repo
 from app.schemas.user import UserCreateRequest, UserUpdateRequest
 from app.tests.utils.utils import random_email, random_lower_string
 
@@ -22,11 +23,15 @@ def user_authentication_headers(
     return headers
 
 
-def create_random_user(db: Session) -> User:
+def create_random_user(db: Session, **kwargs) -> User:
+    """
+    User with random values, `kwargs` overrides them (e.g. the `full_name` a search must find).
+    """
     email = random_email()
     password = random_lower_string()
-    user_in = UserCreateRequest(username=email, email=email, password=password)
-    user = repositories.user.create(db=db, obj_in=user_in)
+    values = dict(username=email, email=email, password=password, full_name=random_lower_string())
+    user_in = UserCreateRequest(**{**values, **kwargs})
+    user = user_repo.create(db=db, obj_in=user_in)
     return user
 
 
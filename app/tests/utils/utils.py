@@ -1,8 +1,11 @@
 import random
 import string
-from typing import Dict
+from contextlib import contextmanager
+from typing import Dict, Generator, List
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
 from app.core.config import settings
 
@@ -25,3 +28,21 @@ def get_superuser_token_headers(client: TestClient) -> Dict[str, str]:
     a_token = tokens["access_token"]
     headers = {"Authorization": f"Bearer {a_token}"}
     return headers
+
+
+@contextmanager
+def capture_statements(db: Session) -> Generator[List[str], None, None]:
+    """
+    SQL statements sent by the engine of `db` inside the block, an executemany counts once.
+    """
+    statements: List[str] = []
+
+    def capture(conn, cursor, statement, *args) -> None:
+        statements.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)